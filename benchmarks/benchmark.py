@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks of the plugin, run with calibre's interpreter:
+
+    calibre-debug -e benchmarks/benchmark.py -- run --output results.json
+    calibre-debug -e benchmarks/benchmark.py -- --fixtures recorded record --title "Lalka" --authors "Bolesław Prus"
+    calibre-debug -e benchmarks/benchmark.py -- --fixtures recorded run --output results.json
+    calibre-debug -e benchmarks/benchmark.py -- import --max-time 0.05
+
+record runs identify and cover download against the live site and stores every fetched page in fixtures
+directory. run replays them from local HTTP server and reports timings as JSON, hand-written fixtures committed
+in benchmarks/fixtures are parsed with benchmarks/fixture_parser.py. import measures loading
+of the plugin in fresh process and fails if it is too slow or pulls in modules meant to be loaded lazily.
+"""
+import argparse
+import gzip
+import hashlib
+import http.server
+import importlib.util
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from queue import Queue
+from threading import Event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+PACKAGE = 'calibre_plugins.biblionetka'
+TIMEOUT = 30
+# modules which should not be imported until identify, download_cover or config_widget is called
+LAZY_MODULES = ('lxml.html', 'PyQt5.QtWidgets', 'http.cookiejar', PACKAGE + '.page_parser',
+                PACKAGE + '.parser_base', PACKAGE + '.cover_fetcher', PACKAGE + '.config_widget')
+
+
+def load_plugin_package():
+    """Imports plugin sources as calibre_plugins.biblionetka package, the way calibre does for installed plugin."""
+
+    if PACKAGE in sys.modules:
+        return sys.modules[PACKAGE]
+
+    if 'calibre_plugins' not in sys.modules:
+        namespace = types.ModuleType('calibre_plugins')
+        namespace.__path__ = []
+        sys.modules['calibre_plugins'] = namespace
+
+    spec = importlib.util.spec_from_file_location(PACKAGE, os.path.join(SRC, '__init__.py'),
+                                                  submodule_search_locations=[SRC])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def install_fixture_parser(name):
+    """
+    Registers parser module from benchmarks directory as plugin's page_parser, used by hand-written fixtures
+    which name it in their index, so that they replay without plugin's parser of the live site.
+    """
+
+    module_name = PACKAGE + '.page_parser'
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, 'benchmarks', name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def url_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+class Fixtures:
+    """Recorded pages along with identify jobs, described by index.json in fixtures directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self.index = {'jobs': [], 'pages': {}}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+        self.by_key = {url_key(url): url for url in self.index['pages']}
+        self.lock = threading.Lock()
+
+    def add_page(self, url, body, content_type):
+        name = url_key(url)
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(body)
+        with self.lock:
+            self.index['pages'][url] = {'file': name, 'content_type': content_type}
+            self.by_key[name] = url
+
+    def add_job(self, title, authors, identifiers):
+        self.index['jobs'].append({'title': title, 'authors': authors, 'identifiers': identifiers})
+
+    def save(self):
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    def read(self, url):
+        with open(os.path.join(self.directory, self.index['pages'][url]['file']), 'rb') as f:
+            return f.read()
+
+    def book_page_urls(self, book_page_url_scheme):
+        prefix = book_page_url_scheme.split('{}')[0]
+        return [url for url in self.index['pages'] if url.startswith(prefix)]
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        fixtures = self.server.fixtures
+        url = fixtures.by_key.get(self.path.lstrip('/'))
+        if url is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = fixtures.read(url)
+        content_type = fixtures.index['pages'][url]['content_type']
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and content_type and content_type.startswith('text/'):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_replay_server(fixtures):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ReplayHandler)
+    server.daemon_threads = True
+    server.fixtures = fixtures
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def install_replay_transports(base_url):
+    """Replaces shared transports with ones sending every request to replay server."""
+
+    transport = importlib.import_module(PACKAGE + '.transport')
+    async_transport = importlib.import_module(PACKAGE + '.async_transport')
+
+    def replay(transport_class):
+        class ReplayTransport(transport_class):
+            def prepare_request(self, method, url, headers):
+                return super().prepare_request(method, '{}/{}'.format(base_url, url_key(url)), headers)
+
+        return ReplayTransport()
+
+    transport._TRANSPORT = replay(transport.HttpTransport)
+    async_transport._ASYNC_TRANSPORT = replay(async_transport.AsyncHttpTransport)
+
+
+def install_recording_transport(fixtures):
+    """Replaces shared transport with one storing every downloaded page in fixtures."""
+
+    transport = importlib.import_module(PACKAGE + '.transport')
+    async_transport = importlib.import_module(PACKAGE + '.async_transport')
+
+    class RecordingTransport(transport.HttpTransport):
+        def request(self, url, headers=None, timeout=None, method='GET', **kwargs):
+            # conditional headers are dropped, so that whole page is always recorded
+            response = super().request(url, None, timeout, method, **kwargs)
+            with response:
+                body = response.read()
+            if response.status == 200:
+                fixtures.add_page(url, body, response.headers.get('Content-Type'))
+            return async_transport.BufferedResponse(response.url, response.status, response.headers, body)
+
+    transport._TRANSPORT = RecordingTransport()
+
+
+class BenchmarkPrefs(dict):
+    """In-memory replacement of plugin's JSONConfig, so benchmarks never modify user's settings."""
+
+
+def make_prefs(plugin_meta, **overrides):
+    prefs = BenchmarkPrefs(plugin_meta.setting_defaults)
+    prefs.update(overrides)
+    prefs.defaults = plugin_meta.setting_defaults
+    return prefs
+
+
+def make_plugin(package, prefs):
+    plugin = package.Biblionetka(None)
+    plugin.PREFS = prefs
+    plugin.COVER_URLS.clear()
+    plugin.BOOKS.clear()
+    return plugin
+
+
+def make_log():
+    from calibre.utils.logging import ThreadSafeLog
+    return ThreadSafeLog(level=ThreadSafeLog.ERROR)
+
+
+def summarize(samples):
+    return {
+        'median': statistics.median(samples),
+        'min': min(samples),
+        'max': max(samples),
+        'samples': len(samples),
+    }
+
+
+def measure(function, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+
+    return summarize(samples), result
+
+
+def measure_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def read_from_memory(parser, fixtures):
+    """Makes parser read pages straight from fixtures, so that only parsing is measured, without network or cache."""
+
+    parser.download_page = lambda url: io.BytesIO(fixtures.read(url))
+    parser.open_page = lambda url, partial_ok=False: io.BytesIO(fixtures.read(url))
+
+
+def parse_uncached(plugin, parser, url):
+    plugin.BOOKS.clear()
+    return parser.parse_book_page(url)
+
+
+def benchmark_parsing(package, fixtures, repeat):
+    """
+    Measures get_lxml_root (full and partial) and each field extractor for every recorded book page.
+    Pages are read from memory, so numbers are time and memory of parsing alone.
+    """
+
+    plugin_meta = importlib.import_module(PACKAGE + '.plugin_meta')
+    page_parser = importlib.import_module(PACKAGE + '.page_parser')
+    plugin = make_plugin(package, make_prefs(plugin_meta, cache=False, rate_limit=0))
+    log = make_log()
+    results = []
+
+    for url in fixtures.book_page_urls(plugin_meta.BOOK_PAGE_URL_SCHEME):
+        parser = page_parser.Parser(plugin, log, TIMEOUT)
+        read_from_memory(parser, fixtures)
+        result = {'url': url, 'bytes': len(fixtures.read(url))}
+        for mode, partial in (('full', False), ('partial', True)):
+            result['get_lxml_root_' + mode], _ = measure(lambda: parser.get_lxml_root(url, partial), repeat)
+            result['get_lxml_root_{}_peak_memory'.format(mode)] = measure_memory(
+                lambda: parser.get_lxml_root(url, partial))
+
+        root = parser.get_lxml_root(url)
+        book_tag = parser.get_book_tag(root)
+        result['fields'] = {}
+        for field, extractor in parser.field_plan.extractors:
+            result['fields'][field], _ = measure(lambda: extractor(root, book_tag, url), repeat)
+        result['parse_book_page'], _ = measure(lambda: parse_uncached(plugin, parser, url), repeat)
+        results.append(result)
+
+    return results
+
+
+def benchmark_identify(package, fixtures, repeat, max_results_values, max_threads_values, async_backend):
+    """Measures identify and following download_cover latency for every recorded job and combination of settings."""
+
+    plugin_meta = importlib.import_module(PACKAGE + '.plugin_meta')
+    log = make_log()
+    results = []
+
+    for max_results in max_results_values:
+        for max_threads in max_threads_values:
+            prefs = make_prefs(plugin_meta, cache=False, max_results=max_results, max_threads=max_threads,
+                               threads=max_threads > 1, async_backend=async_backend, rate_limit=0)
+            identify_samples = []
+            cover_samples = []
+            results_count = 0
+            covers_count = 0
+            for _ in range(repeat):
+                for job in fixtures.index['jobs']:
+                    plugin = make_plugin(package, prefs)
+                    queue = Queue()
+                    start = time.perf_counter()
+                    plugin.identify(log, queue, Event(), job['title'], job['authors'], job['identifiers'], TIMEOUT)
+                    identify_samples.append(time.perf_counter() - start)
+                    results_count += queue.qsize()
+
+                    identifiers = queue.get().identifiers if not queue.empty() else job['identifiers']
+                    covers = Queue()
+                    start = time.perf_counter()
+                    plugin.download_cover(log, covers, Event(), job['title'], job['authors'], identifiers, TIMEOUT)
+                    cover_samples.append(time.perf_counter() - start)
+                    covers_count += covers.qsize()
+
+            if not identify_samples:
+                continue
+
+            results.append({
+                'max_results': max_results,
+                'max_threads': max_threads,
+                'async_backend': async_backend,
+                'identify': summarize(identify_samples),
+                'download_cover': summarize(cover_samples),
+                'results': results_count,
+                'covers': covers_count,
+            })
+
+    return results
+
+
+def benchmark_import():
+    """Measures loading plugin package and creating plugin instance, as calibre does on startup."""
+
+    loaded = set(sys.modules)
+    start = time.perf_counter()
+    package = load_plugin_package()
+    package.Biblionetka(None)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'time': elapsed,
+        'modules': len(set(sys.modules) - loaded),
+        'lazy_modules_loaded': sorted(name for name in LAZY_MODULES if name in sys.modules and name not in loaded),
+    }
+
+
+def import_time(args):
+    if PACKAGE in sys.modules:
+        sys.exit('Plugin already imported, run import benchmark in fresh process')
+
+    result = benchmark_import()
+    print(json.dumps(result, indent=2, sort_keys=True))
+    if result['lazy_modules_loaded']:
+        sys.exit('Modules loaded eagerly: {}'.format(', '.join(result['lazy_modules_loaded'])))
+    if args.max_time and result['time'] > args.max_time:
+        sys.exit('Import took {:.3f}s, more than {:.3f}s'.format(result['time'], args.max_time))
+
+
+def record(args):
+    os.makedirs(args.fixtures, exist_ok=True)
+    package = load_plugin_package()
+    plugin_meta = importlib.import_module(PACKAGE + '.plugin_meta')
+    fixtures = Fixtures(args.fixtures)
+    install_recording_transport(fixtures)
+
+    prefs = make_prefs(plugin_meta, cache=False, max_results=args.max_results, async_backend=False)
+    plugin = make_plugin(package, prefs)
+    log = make_log()
+    identifiers = {plugin_meta.IDENTIFIER: args.id} if args.id else {}
+    queue = Queue()
+    plugin.identify(log, queue, Event(), args.title, args.authors, identifiers, TIMEOUT)
+    while not queue.empty():
+        mi = queue.get()
+        plugin.download_cover(log, Queue(), Event(), args.title, args.authors, mi.identifiers, TIMEOUT)
+
+    fixtures.add_job(args.title, args.authors, identifiers)
+    fixtures.save()
+    print('Recorded {} pages'.format(len(fixtures.index['pages'])))
+
+
+def run(args):
+    package = load_plugin_package()
+    fixtures = Fixtures(args.fixtures)
+    if not fixtures.index['pages']:
+        sys.exit('No fixtures in {}, record them first'.format(args.fixtures))
+
+    if fixtures.index.get('parser'):
+        install_fixture_parser(fixtures.index['parser'])
+
+    server = start_replay_server(fixtures)
+    install_replay_transports('http://127.0.0.1:{}'.format(server.server_address[1]))
+
+    from calibre.constants import __version__
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'calibre': __version__,
+        'parsing': benchmark_parsing(package, fixtures, args.repeat),
+        'identify': benchmark_identify(package, fixtures, args.repeat, args.max_results, args.max_threads, False),
+    }
+    if args.async_backend:
+        report['identify'] += benchmark_identify(package, fixtures, args.repeat, args.max_results,
+                                                 args.max_threads, True)
+    server.shutdown()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the plugin')
+    parser.add_argument('--fixtures', default=FIXTURES, help='directory with recorded pages')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    record_parser = commands.add_parser('record', help='record pages fetched while identifying book')
+    record_parser.add_argument('--title', required=True)
+    record_parser.add_argument('--authors', nargs='*', default=[])
+    record_parser.add_argument('--id', help='biblionetka identifier of the book')
+    record_parser.add_argument('--max-results', type=int, default=5)
+    record_parser.set_defaults(function=record)
+
+    run_parser = commands.add_parser('run', help='run benchmarks against recorded pages')
+    run_parser.add_argument('--repeat', type=int, default=5)
+    run_parser.add_argument('--max-results', type=int, nargs='+', default=[1, 2, 5])
+    run_parser.add_argument('--max-threads', type=int, nargs='+', default=[1, 3, 8])
+    run_parser.add_argument('--async-backend', action='store_true', help='also benchmark asyncio backend')
+    run_parser.add_argument('--output', help='JSON report path, printed to stdout by default')
+    run_parser.set_defaults(function=run)
+
+    import_parser = commands.add_parser('import', help='measure plugin import time in fresh process')
+    import_parser.add_argument('--max-time', type=float, help='fail if import takes more seconds')
+    import_parser.set_defaults(function=import_time)
+
+    args = parser.parse_args(argv)
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,111 @@
+"""
+Parser of hand-written pages in benchmarks/fixtures, loaded as plugin's page_parser when fixtures index asks for it.
+It mimics layout of biblionetka.pl pages closely enough to exercise whole identify and cover download path offline.
+"""
+import datetime
+import re
+import urllib.parse
+
+import lxml.html
+
+from .parser_base import ParserBase, SearchResult
+
+
+class Parser(ParserBase):
+    url_scheme_title = 'http://www.biblionetka.pl/search.aspx?searchType=book&searchPhrase={title}'
+    url_scheme_title_authors = 'http://www.biblionetka.pl/search.aspx?searchType=book&searchPhrase={title}&author={authors}'
+    book_tag_xpath = '//div[@id="book"]'
+    SELECTORS = {
+        'search_results': '//ul[@id="results"]/li',
+        'search_title': './/a[@class="title"]',
+        'search_authors': './/span[@class="authors"]/text()',
+        'title': './/h1[@class="title"]/text()',
+        'authors': './/p[@class="authors"]/a/text()',
+        'pubdate': './/p[@class="pubdate"]/text()',
+        'languages': './/p[@class="language"]/@data-code',
+        'rating': './/p[@class="rating"]/text()',
+        'tags': './/ul[@class="tags"]/li/text()',
+        'series': './/p[@class="series"]',
+        'translators': './/p[@class="translators"]/a/text()',
+        'original_title': './/p[@class="original-title"]/text()',
+        'categories': './/p[@class="category"]/text()',
+        'genres': './/p[@class="genre"]/text()',
+        'comments': './/div[@class="description"]',
+        'covers': './/img[@class="cover"]/@src',
+    }
+    partial_parse_selectors = ('book_tag',)
+
+    def parse_search_page(self, url, title, authors, with_authors=False, only_first_author=False):
+        root = self.get_lxml_root(url)
+        if root is None:
+            return None
+
+        results = []
+        for result in self.select('search_results', root):
+            link = self.select_first('search_title', result)
+            if link is None:
+                continue
+            results.append(SearchResult(urllib.parse.urljoin(url, link.get('href')), link.text_content().strip(),
+                                        self.get_names(self.select_first('search_authors', result, ''))))
+
+        return results
+
+    def parse_series(self, root_tag, book_tag, url):
+        series = []
+        for node in self.select('series', book_tag):
+            index = node.get('data-index')
+            series.append((node.text_content().strip(), float(index) if index else None))
+
+        return series
+
+    def parse_authors(self, root_tag, book_tag, url):
+        return [author.strip() for author in self.select('authors', book_tag)]
+
+    def parse_covers(self, root_tag, book_tag, url):
+        return [urllib.parse.urljoin(url, src) for src in self.select('covers', book_tag)]
+
+    def parse_identifier(self, root_tag, book_tag, url):
+        match = re.search(r'[?&]id=(\d+)', url)
+        return match.group(1) if match else None
+
+    def parse_languages(self, root_tag, book_tag, url):
+        return list(self.select('languages', book_tag))
+
+    def parse_rating(self, root_tag, book_tag, url):
+        rating = self.select_first('rating', book_tag)
+        return round(float(rating)) if rating else None
+
+    def parse_tags(self, root_tag, book_tag, url):
+        return [tag.strip() for tag in self.select('tags', book_tag)]
+
+    def parse_title(self, root_tag, book_tag, url):
+        return self.select_first('title', book_tag, '').strip()
+
+    def parse_pubdate(self, root_tag, book_tag, url):
+        year = self.select_first('pubdate', book_tag)
+        if not year:
+            return None
+
+        return datetime.datetime(int(year), 1, 1, tzinfo=datetime.timezone.utc)
+
+    def parse_translators(self, root_tag, book_tag, url):
+        return [translator.strip() for translator in self.select('translators', book_tag)]
+
+    def parse_original_title(self, root_tag, book_tag, url):
+        original_title = self.select_first('original_title', book_tag)
+        return original_title.strip() if original_title else None
+
+    def parse_categories(self, root_tag, book_tag, url):
+        categories = self.select_first('categories', book_tag)
+        return categories.strip() if categories else None
+
+    def parse_genres(self, root_tag, book_tag, url):
+        genres = self.select_first('genres', book_tag)
+        return genres.strip() if genres else None
+
+    def parse_comments(self, root_tag, book_tag, url):
+        description = self.select_first('comments', book_tag)
+        if description is None:
+            return None
+
+        return lxml.html.tostring(description, encoding='unicode')
@@ -0,0 +1,257 @@
+import asyncio
+import http.client
+import io
+import socket
+import ssl
+import threading
+import urllib.error
+import urllib.parse
+
+from .transport import HttpTransport, get_decoder, decode
+from .throttle import RateLimitTimeout
+from .metrics import NULL_METRICS
+
+
+class BufferedResponse:
+    """HTTP response with body already read and decoded on the event loop."""
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = io.BytesIO(body)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def read(self, amt=None):
+        return self.body.read() if amt is None else self.body.read(amt)
+
+    def close(self):
+        pass
+
+
+class AsyncHttpTransport(HttpTransport):
+    """
+    HTTP client running all requests concurrently on a single asyncio event loop thread, using stdlib streams.
+    Offers blocking request() of HttpTransport along with submit() returning future.
+    """
+
+    is_async = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.loop = None
+        self.loop_lock = threading.Lock()
+        self.streams = {}  # accessed only from event loop thread
+
+    def get_loop(self):
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self.loop.run_forever, name='biblionetka-fetch', daemon=True)
+                thread.start()
+
+            return self.loop
+
+    def submit(self, url, headers=None, timeout=None, method='GET', metrics=NULL_METRICS, deadline=None):
+        """Schedules request on event loop and returns concurrent.futures.Future with BufferedResponse."""
+
+        coroutine = self.fetch(url, headers or {}, timeout, method, metrics, deadline)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.get_loop())
+
+    def request(self, url, headers=None, timeout=None, method='GET', metrics=NULL_METRICS, deadline=None):
+        return self.submit(url, headers, timeout, method, metrics, deadline).result()
+
+    def close(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.close_streams(), self.loop).result()
+
+    async def close_streams(self):
+        for streams in self.streams.values():
+            for _, writer in streams:
+                writer.close()
+        self.streams.clear()
+
+    async def fetch(self, url, headers, timeout, method, metrics, deadline):
+        """Sends request following redirects, retrying it the same way as HttpTransport.request."""
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            if attempt:
+                metrics.count('retries')
+            if deadline and deadline.expired():
+                raise socket.timeout('time budget exhausted')
+            request_timeout = deadline.timeout(timeout) if deadline else timeout
+            try:
+                response = await self.fetch_once(url, headers, request_timeout, method, metrics, deadline)
+            except RateLimitTimeout:
+                raise
+            except (urllib.error.URLError, socket.timeout):
+                delay = self.backoff(attempt)
+                if last_attempt or (deadline and not deadline.allows(delay)):
+                    raise
+            else:
+                if response.status not in self.RETRY_CODES or last_attempt:
+                    return response
+                delay = max(self.get_retry_after(response), self.backoff(attempt))
+                if deadline and not deadline.allows(delay):
+                    return response
+                self.pause_host(response, delay)
+
+            await asyncio.sleep(delay)
+
+    async def fetch_once(self, url, headers, timeout, method, metrics, deadline=None):
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = await self.send_async(method, url, headers, timeout, metrics, deadline)
+            location = response.headers.get('Location')
+            if response.status not in self.REDIRECT_CODES or not location:
+                return response
+
+            url = urllib.parse.urljoin(url, location)
+            if response.status == 303:
+                method = 'GET'
+
+        raise urllib.error.URLError('Too many redirects: {}'.format(url))
+
+    async def send_async(self, method, url, headers, timeout, metrics, deadline=None):
+        key, path, req, request_headers = self.prepare_request(method, url, headers)
+        scheme, host, port = key
+        default_port = 443 if scheme == 'https' else 80
+        request_headers['Host'] = host if port == default_port else '{}:{}'.format(host, port)
+
+        with metrics.phase('rate_limit'):
+            await asyncio.sleep(self.limiter(host).reserve(deadline))
+        metrics.count('requests')
+        while True:
+            with metrics.phase('connect'):
+                reader, writer, reused = await self.open_stream(key, timeout)
+            try:
+                status, headers, body, keep_alive = await asyncio.wait_for(
+                    self.exchange(reader, writer, method, path, request_headers, metrics), timeout)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                if not reused:
+                    raise urllib.error.URLError(e)
+                # persistent connection was closed by server in the meantime, retry with fresh one
+            except asyncio.TimeoutError:
+                writer.close()
+                raise socket.timeout('timed out')
+            except urllib.error.URLError:
+                writer.close()
+                raise
+            except (OSError, ValueError, asyncio.LimitOverrunError, http.client.HTTPException) as e:
+                writer.close()
+                raise urllib.error.URLError(e)
+
+        if keep_alive:
+            self.release_stream(key, reader, writer)
+        else:
+            writer.close()
+
+        response = BufferedResponse(url, status, headers, body)
+        self.cookies.extract_cookies(response, req)
+        return response
+
+    async def open_stream(self, key, timeout):
+        """Returns idle stream to host or a new one, along with information whether it was reused."""
+
+        streams = self.streams.get(key)
+        while streams:
+            reader, writer = streams.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+
+        scheme, host, port = key
+        ssl_context = ssl.create_default_context() if scheme == 'https' else None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ssl_context), timeout)
+        except asyncio.TimeoutError:
+            raise socket.timeout('timed out')
+        except OSError as e:
+            raise urllib.error.URLError(e)
+
+        return reader, writer, False
+
+    def release_stream(self, key, reader, writer):
+        streams = self.streams.setdefault(key, [])
+        if len(streams) < self.MAX_IDLE_CONNECTIONS:
+            streams.append((reader, writer))
+        else:
+            writer.close()
+
+    async def exchange(self, reader, writer, method, path, request_headers, metrics):
+        """Sends request and reads whole response, returns status, headers, decoded body and keep-alive flag."""
+
+        lines = ['{} {} HTTP/1.1'.format(method, path)]
+        lines.extend('{}: {}'.format(name, value) for name, value in request_headers.items())
+        with metrics.phase('first_byte'):
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+
+        status_line, _, header_block = head.partition(b'\r\n')
+        version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+        status = int(status)
+        headers = http.client.parse_headers(io.BytesIO(header_block))
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('Connection', '').lower() != 'close'
+        with metrics.phase('body'):
+            if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+                body = b''
+            elif 'chunked' in headers.get('Transfer-Encoding', '').lower():
+                body = await self.read_chunked(reader)
+            elif headers.get('Content-Length') is not None:
+                body = await reader.readexactly(int(headers['Content-Length']))
+            else:
+                body = await reader.read()
+                keep_alive = False
+        metrics.count('bytes_wire', len(body))
+
+        decoder = get_decoder(headers.get('Content-Encoding'))
+        if decoder is not None:
+            body = decode(decoder, body)
+        metrics.count('bytes', len(body))
+
+        return status, headers, body, keep_alive
+
+    async def read_chunked(self, reader):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip(), 16)
+            if size == 0:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+        # skip trailers
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+
+        return b''.join(chunks)
+
+
+_ASYNC_TRANSPORT = None
+_ASYNC_TRANSPORT_LOCK = threading.Lock()
+
+
+def get_async_transport():
+    """Returns asyncio based transport shared by all parser instances, starting it on first use."""
+
+    global _ASYNC_TRANSPORT
+    with _ASYNC_TRANSPORT_LOCK:
+        if _ASYNC_TRANSPORT is None:
+            _ASYNC_TRANSPORT = AsyncHttpTransport()
+
+        return _ASYNC_TRANSPORT
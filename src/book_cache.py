@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from .cache_database import DATABASE
+
+CachedBook = namedtuple('CachedBook', ('mi', 'covers'))
+
+# Metadata attributes stored as they are, pubdate and identifiers are handled separately
+METADATA_FIELDS = ('title', 'authors', 'languages', 'rating', 'tags', 'has_cover', 'series', 'series_index', 'comments')
+
+
+def metadata_to_json(mi):
+    from calibre.utils.date import isoformat
+    data = {field: getattr(mi, field) for field in METADATA_FIELDS}
+    data['identifiers'] = mi.get_identifiers()
+    data['pubdate'] = isoformat(mi.pubdate) if mi.pubdate else None
+    return json.dumps(data)
+
+
+def json_to_metadata(text):
+    # imported on first use, plugin_base imports this module at calibre startup
+    from calibre.ebooks.metadata.book.base import Metadata
+    from calibre.utils.date import parse_date
+    data = json.loads(text)
+    mi = Metadata(data['title'], data['authors'])
+    for field in METADATA_FIELDS[2:]:
+        if data.get(field) is not None:
+            setattr(mi, field, data[field])
+    mi.set_identifiers(data['identifiers'])
+    if data['pubdate']:
+        mi.pubdate = parse_date(data['pubdate'])
+
+    return mi
+
+
+class BookCache:
+    """
+    Parsed book pages (Metadata and cover urls) shared by calibre worker processes, keyed by book page url and
+    set of extracted fields, cover urls can be looked up by biblionetka id. Leases let one process fetch given page or search while others wait for its result.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, database, ttl=0):
+        self.database = database
+        self.lock = database.lock
+        self.ttl = ttl
+        self.owner = '{}:{}'.format(os.getpid(), id(self))
+
+    def configure(self, ttl):
+        """Sets time to live (in seconds) of cached books."""
+
+        self.ttl = ttl
+
+    def connection(self):
+        return self.database.connection()
+
+    def get(self, url, fields):
+        """Returns CachedBook parsed from book page at url with given fields or None if it is not cached or expired."""
+
+        with self.lock:
+            row = self.connection().execute('SELECT metadata, covers FROM books '
+                                            'WHERE url = ? AND fields = ? AND fetched > ?',
+                                            (url, self.get_fields_key(fields), time.time() - self.ttl)).fetchone()
+
+        if row is None:
+            return None
+
+        return CachedBook(json_to_metadata(row[0]), json.loads(row[1]) if row[1] is not None else None)
+
+    def contains(self, url, fields):
+        """Checks if book page parsed with given fields is cached, without reading it."""
+
+        with self.lock:
+            row = self.connection().execute('SELECT 1 FROM books WHERE url = ? AND fields = ? AND fetched > ?',
+                                            (url, self.get_fields_key(fields), time.time() - self.ttl)).fetchone()
+
+        return row is not None
+
+    def get_covers(self, id_):
+        """Returns cover urls of book with given biblionetka id, empty list if it has no cover or None if unknown."""
+
+        with self.lock:
+            row = self.connection().execute('SELECT covers FROM books '
+                                            'WHERE id = ? AND covers IS NOT NULL AND fetched > ? '
+                                            'ORDER BY fetched DESC LIMIT 1',
+                                            (id_, time.time() - self.ttl)).fetchone()
+
+        if row is None or row[0] is None:
+            return None
+
+        return json.loads(row[0])
+
+    def get_fields_key(self, fields):
+        return ','.join(sorted(fields))
+
+    def put(self, url, fields, id_, mi, covers):
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            conn.execute('INSERT OR REPLACE INTO books (url, fields, id, metadata, covers, fetched) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (url, self.get_fields_key(fields), id_, metadata_to_json(mi),
+                          json.dumps(covers) if covers is not None else None, now))
+            conn.execute('DELETE FROM books WHERE fetched <= ?', (now - self.ttl,))
+            conn.commit()
+
+    def claim(self, key, ttl):
+        """
+        Takes lease on fetching key (e.g. book page url) for ttl seconds, returns False if other process
+        or thread holds it already. Expired leases, left by crashed workers, are taken over.
+        """
+
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM leases WHERE key = ? AND expires <= ?', (key, now))
+                cursor = conn.execute('INSERT OR IGNORE INTO leases (key, owner, expires) VALUES (?, ?, ?)',
+                                      (key, self.get_owner(), now + ttl))
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+
+        return cursor.rowcount == 1
+
+    def release(self, key):
+        with self.lock:
+            conn = self.connection()
+            conn.execute('DELETE FROM leases WHERE key = ? AND owner = ?', (key, self.get_owner()))
+            conn.commit()
+
+    def wait_for_release(self, key, deadline):
+        """Waits until lease on key is released or expires, but not past deadline. Returns True if it was released."""
+
+        while not deadline.expired():
+            with self.lock:
+                row = self.connection().execute('SELECT 1 FROM leases WHERE key = ? AND expires > ?',
+                                                (key, time.time())).fetchone()
+            if row is None:
+                return True
+            time.sleep(self.POLL_INTERVAL)
+
+        return False
+
+    def get_owner(self):
+        return '{}:{}'.format(self.owner, threading.get_ident())
+
+    def clear(self):
+        """Removes all books and expired leases, leases of fetches in progress are kept."""
+
+        with self.lock:
+            conn = self.connection()
+            conn.execute('DELETE FROM books')
+            conn.execute('DELETE FROM leases WHERE expires <= ?', (time.time(),))
+            conn.commit()
+
+
+_CACHE = BookCache(DATABASE)
+
+
+def get_book_cache(settings=None):
+    """Returns the parsed books cache, expiring entries after cache_ttl from settings if given."""
+
+    if settings is not None:
+        _CACHE.configure(settings.cache_ttl * 3600)
+
+    return _CACHE
@@ -0,0 +1,101 @@
+import os
+import sqlite3
+import threading
+
+from .plugin_meta import IDENTIFIER
+
+BUSY_TIMEOUT = 10  # seconds to wait for database locked by other process
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS responses ('
+    'url TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, last_modified TEXT, '
+    'fetched REAL NOT NULL, accessed REAL NOT NULL, size INTEGER NOT NULL, '
+    'complete INTEGER NOT NULL DEFAULT 1)',
+    'CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)',
+    'CREATE TABLE IF NOT EXISTS searches (key TEXT PRIMARY KEY, urls TEXT NOT NULL, fetched REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS books ('
+    'url TEXT NOT NULL, fields TEXT NOT NULL, id TEXT, metadata TEXT NOT NULL, covers TEXT, fetched REAL NOT NULL, '
+    'PRIMARY KEY (url, fields))',
+    'CREATE INDEX IF NOT EXISTS books_id ON books (id)',
+    'CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)',
+)
+# tables dropped (and created anew) if they lack given column, used when primary key of cache table changed
+RECREATED_TABLES = (
+    ('books', 'fields'),
+)
+# columns added after table was first released, with their definitions
+MIGRATIONS = (
+    ('responses', 'complete', 'INTEGER NOT NULL DEFAULT 1'),
+)
+
+
+class CacheDatabase:
+    """
+    SQLite database holding all plugin caches, shared by calibre worker processes. Owns single connection,
+    used under lock, and schema. WAL mode lets readers work alongside single writer, writers wait up to
+    BUSY_TIMEOUT for each other.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = None
+
+    def connection(self):
+        """Returns connection, opened on first use. Raises sqlite3.Error if database can not be opened."""
+
+        with self.lock:
+            if self.conn is None:
+                if self.path is None:
+                    self.path = get_cache_path()
+                try:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                except OSError as e:
+                    raise sqlite3.OperationalError('Could not create cache directory: {}'.format(e))
+                conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+                try:
+                    conn.execute('PRAGMA journal_mode=WAL')
+                    conn.execute('PRAGMA synchronous=NORMAL')
+                    self.create_schema(conn)
+                except sqlite3.Error:
+                    # e.g. file is not a database, opening is retried on next use
+                    conn.close()
+                    raise
+                self.conn = conn
+
+            return self.conn
+
+    def create_schema(self, conn):
+        for table, column in RECREATED_TABLES:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info({})'.format(table))]
+            if columns and column not in columns:
+                conn.execute('DROP TABLE {}'.format(table))
+        for statement in SCHEMA:
+            conn.execute(statement)
+        for table, column, definition in MIGRATIONS:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info({})'.format(table))]
+            if column not in columns:
+                conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(table, column, definition))
+        conn.commit()
+
+
+def get_cache_path():
+    # imported on first use, so that caches can be created without calibre (e.g. in tests)
+    from calibre.constants import config_dir
+    return os.path.join(config_dir, 'plugins', '{}_cache.sqlite'.format(IDENTIFIER))
+
+
+def call_cache(log, method, *args, default=None):
+    """
+    Returns result of cache method or default if it fails with SQLite error, e.g. database is corrupted or locked
+    for longer than BUSY_TIMEOUT. Cache only saves requests, so its failure is logged and fetching goes on without it.
+    """
+
+    try:
+        return method(*args)
+    except sqlite3.Error as e:
+        log.error('ERROR: Cache failed, continuing without it: {}'.format(e))
+        return default
+
+
+DATABASE = CacheDatabase()  # calibre's config directory is resolved on first use
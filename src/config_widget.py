@@ -4,16 +4,20 @@ __copyright__ = '2017-2020, fenuks'
 __docformat__ = 'restructuredtext en'
 
 from PyQt5.Qt import Qt, QWidget, QFormLayout, QVBoxLayout, QHBoxLayout, QGroupBox, \
-    QLabel, QLineEdit, QIntValidator, QDoubleValidator, QCheckBox
+    QLabel, QLineEdit, QIntValidator, QDoubleValidator, QCheckBox, QPushButton
 
 from .utils import get_prefs
-
-PREFS = get_prefs()
+from .settings import invalidate_settings
+from .response_cache import get_response_cache
+from .search_cache import get_search_cache
+from .book_cache import get_book_cache
 
 
 class ConfigWidget(QWidget):
-    def __init__(self):
+    def __init__(self, plugin=None):
         QWidget.__init__(self)
+        self.plugin = plugin
+        self.prefs = get_prefs()
 
         self.main_layout = QVBoxLayout()
         self.l = QFormLayout()
@@ -30,27 +34,27 @@ class ConfigWidget(QWidget):
 pierwszy wynik może być niepoprawny')
         self.max_results = QLineEdit(self)
         self.max_results.setValidator(QIntValidator())
-        self.max_results.setText(str(PREFS['max_results']))
+        self.max_results.setText(str(self.prefs['max_results']))
         self.max_results_label.setBuddy(self.max_results)
         self.l.addRow(self.max_results_label, self.max_results)
 
         self.authors_search_label = QLabel('Używaj autorów do wyszukiwań')
         self.authors_search_label.setToolTip('Wyszukuj uwzględniając autorów. Może poprawić trafność wyników, ale błędni autorzy spowodują brak wyników')
         self.authors_search = QCheckBox()
-        self.authors_search.setChecked(PREFS['authors_search'])
+        self.authors_search.setChecked(self.prefs['authors_search'])
         self.authors_search_label.setBuddy(self.authors_search)
         self.l.addRow(self.authors_search_label, self.authors_search)
 
         self.only_first_author_label = QLabel('Używaj tylko pierwszego autora do wyszukiwania')
         self.only_first_author_label.setToolTip('Używaj tylko pierwszego autora do wyszukiwań, obowiązuje tylko gdy wyszukiwanie z autorami jest aktywowane')
         self.only_first_author = QCheckBox()
-        self.only_first_author.setChecked(PREFS['only_first_author'])
+        self.only_first_author.setChecked(self.prefs['only_first_author'])
         self.only_first_author_label.setBuddy(self.only_first_author)
         self.l.addRow(self.only_first_author_label, self.only_first_author)
 
         self.covers_label = QLabel('Pobieraj okładki')
         self.covers = QCheckBox()
-        self.covers.setChecked(PREFS['covers'])
+        self.covers.setChecked(self.prefs['covers'])
         self.covers_label.setBuddy(self.covers)
         self.l.addRow(self.covers_label, self.covers)
 
@@ -58,21 +62,44 @@ pierwszy wynik może być niepoprawny')
         self.max_covers_label.setToolTip('Maksymalna liczba pobieranych okładek')
         self.max_covers = QLineEdit(self)
         self.max_covers.setValidator(QIntValidator())
-        self.max_covers.setText(str(PREFS['max_covers']))
+        self.max_covers.setText(str(self.prefs['max_covers']))
         self.max_covers_label.setBuddy(self.max_covers)
         self.l.addRow(self.max_covers_label, self.max_covers)
 
+        self.cover_probe_label = QLabel('Porównuj okładki przed pobraniem')
+        self.cover_probe_label.setToolTip('Odczytuje wymiary okładek z nagłówków obrazów i pobiera tylko najlepsze z nich')
+        self.cover_probe = QCheckBox()
+        self.cover_probe.setChecked(self.prefs['cover_probe'])
+        self.cover_probe_label.setBuddy(self.cover_probe)
+        self.l.addRow(self.cover_probe_label, self.cover_probe)
+
+        self.max_cover_downloads_label = QLabel('Liczba pobieranych najlepszych okładek')
+        self.max_cover_downloads_label.setToolTip('Liczba okładek pobieranych w całości po porównaniu ich wymiarów')
+        self.max_cover_downloads = QLineEdit(self)
+        self.max_cover_downloads.setValidator(QIntValidator())
+        self.max_cover_downloads.setText(str(self.prefs['max_cover_downloads']))
+        self.max_cover_downloads_label.setBuddy(self.max_cover_downloads)
+        self.l.addRow(self.max_cover_downloads_label, self.max_cover_downloads)
+
+        self.cover_prefetch_label = QLabel('Pobieraj okładki w tle')
+        self.cover_prefetch_label.setToolTip('Pobiera najlepszą okładkę w tle podczas wyszukiwania metadanych, \
+wymaga włączonej pamięci podręcznej')
+        self.cover_prefetch = QCheckBox()
+        self.cover_prefetch.setChecked(self.prefs['cover_prefetch'])
+        self.cover_prefetch_label.setBuddy(self.cover_prefetch)
+        self.l.addRow(self.cover_prefetch_label, self.cover_prefetch)
+
         self.threads_label = QLabel('Wielowątkowe przetwarzanie')
         self.threads_label.setToolTip('Przyśpiesza pracę używając wielu wątków')
         self.threads = QCheckBox()
-        self.threads.setChecked(PREFS['threads'])
+        self.threads.setChecked(self.prefs['threads'])
         self.threads_label.setBuddy(self.threads)
         self.l.addRow(self.threads_label, self.threads)
 
         self.max_threads_label = QLabel('Maksymalna liczba wątków')
         self.max_threads = QLineEdit(self)
         self.max_threads.setValidator(QIntValidator())
-        self.max_threads.setText(str(PREFS['max_threads']))
+        self.max_threads.setText(str(self.prefs['max_threads']))
         self.max_threads_label.setBuddy(self.max_threads)
         self.l.addRow(self.max_threads_label, self.max_threads)
 
@@ -80,85 +107,181 @@ pierwszy wynik może być niepoprawny')
         self.thread_delay_label.setToolTip('Czas oczekiwania na uruchomienie kolejnego wątku')
         self.thread_delay = QLineEdit(self)
         self.thread_delay.setValidator(QDoubleValidator())
-        self.thread_delay.setText(str(PREFS['thread_delay']))
+        self.thread_delay.setText(str(self.prefs['thread_delay']))
         self.thread_delay_label.setBuddy(self.thread_delay)
         self.l.addRow(self.thread_delay_label, self.thread_delay)
 
+        self.async_backend_label = QLabel('Asynchroniczne pobieranie')
+        self.async_backend_label.setToolTip('Pobiera wszystkie strony i okładki naraz w jednym wątku (asyncio) zamiast wątku na każde zapytanie')
+        self.async_backend = QCheckBox()
+        self.async_backend.setChecked(self.prefs['async_backend'])
+        self.async_backend_label.setBuddy(self.async_backend)
+        self.l.addRow(self.async_backend_label, self.async_backend)
+
+        self.rate_limit_label = QLabel('Limit zapytań na sekundę')
+        self.rate_limit_label.setToolTip('Maksymalna liczba zapytań wysyłanych do serwera na sekundę, 0 wyłącza limit')
+        self.rate_limit = QLineEdit(self)
+        self.rate_limit.setValidator(QDoubleValidator())
+        self.rate_limit.setText(str(self.prefs['rate_limit']))
+        self.rate_limit_label.setBuddy(self.rate_limit)
+        self.l.addRow(self.rate_limit_label, self.rate_limit)
+
+        self.rate_burst_label = QLabel('Maksymalna liczba zapytań naraz')
+        self.rate_burst_label.setToolTip('Liczba zapytań, które mogą zostać wysłane naraz, zanim zacznie działać limit')
+        self.rate_burst = QLineEdit(self)
+        self.rate_burst.setValidator(QIntValidator())
+        self.rate_burst.setText(str(self.prefs['rate_burst']))
+        self.rate_burst_label.setBuddy(self.rate_burst)
+        self.l.addRow(self.rate_burst_label, self.rate_burst)
+
+        self.max_retries_label = QLabel('Liczba ponowień zapytania')
+        self.max_retries_label.setToolTip('Ile razy ponowić nieudane zapytanie lub zapytanie odrzucone przez przeciążony serwer')
+        self.max_retries = QLineEdit(self)
+        self.max_retries.setValidator(QIntValidator())
+        self.max_retries.setText(str(self.prefs['max_retries']))
+        self.max_retries_label.setBuddy(self.max_retries)
+        self.l.addRow(self.max_retries_label, self.max_retries)
+
+        self.retry_backoff_label = QLabel('Opóźnienie ponowienia')
+        self.retry_backoff_label.setToolTip('Czas oczekiwania przed ponowieniem zapytania, podwajany przy każdej kolejnej próbie')
+        self.retry_backoff = QLineEdit(self)
+        self.retry_backoff.setValidator(QDoubleValidator())
+        self.retry_backoff.setText(str(self.prefs['retry_backoff']))
+        self.retry_backoff_label.setBuddy(self.retry_backoff)
+        self.l.addRow(self.retry_backoff_label, self.retry_backoff)
+
+        self.cache_label = QLabel('Pamięć podręczna stron')
+        self.cache_label.setToolTip('Zapisuje pobrane strony na dysku, aby nie pobierać ich ponownie')
+        self.cache = QCheckBox()
+        self.cache.setChecked(self.prefs['cache'])
+        self.cache_label.setBuddy(self.cache)
+        self.l.addRow(self.cache_label, self.cache)
+
+        self.cache_ttl_label = QLabel('Ważność pamięci podręcznej (godziny)')
+        self.cache_ttl_label.setToolTip('Po tym czasie strona jest sprawdzana na serwerze ponownie')
+        self.cache_ttl = QLineEdit(self)
+        self.cache_ttl.setValidator(QIntValidator())
+        self.cache_ttl.setText(str(self.prefs['cache_ttl']))
+        self.cache_ttl_label.setBuddy(self.cache_ttl)
+        self.l.addRow(self.cache_ttl_label, self.cache_ttl)
+
+        self.cache_max_size_label = QLabel('Rozmiar pamięci podręcznej (MB)')
+        self.cache_max_size_label.setToolTip('Po przekroczeniu rozmiaru usuwane są najdawniej używane strony')
+        self.cache_max_size = QLineEdit(self)
+        self.cache_max_size.setValidator(QIntValidator())
+        self.cache_max_size.setText(str(self.prefs['cache_max_size']))
+        self.cache_max_size_label.setBuddy(self.cache_max_size)
+        self.l.addRow(self.cache_max_size_label, self.cache_max_size)
+
+        self.search_cache_ttl_label = QLabel('Ważność wyników wyszukiwania (godziny)')
+        self.search_cache_ttl_label.setToolTip('Jak długo pamiętać wyniki wyszukiwań, które znalazły książki')
+        self.search_cache_ttl = QLineEdit(self)
+        self.search_cache_ttl.setValidator(QIntValidator())
+        self.search_cache_ttl.setText(str(self.prefs['search_cache_ttl']))
+        self.search_cache_ttl_label.setBuddy(self.search_cache_ttl)
+        self.l.addRow(self.search_cache_ttl_label, self.search_cache_ttl)
+
+        self.search_cache_miss_ttl_label = QLabel('Ważność pustych wyników wyszukiwania (godziny)')
+        self.search_cache_miss_ttl_label.setToolTip('Jak długo pamiętać wyszukiwania, które nie znalazły żadnej książki')
+        self.search_cache_miss_ttl = QLineEdit(self)
+        self.search_cache_miss_ttl.setValidator(QIntValidator())
+        self.search_cache_miss_ttl.setText(str(self.prefs['search_cache_miss_ttl']))
+        self.search_cache_miss_ttl_label.setBuddy(self.search_cache_miss_ttl)
+        self.l.addRow(self.search_cache_miss_ttl_label, self.search_cache_miss_ttl)
+
+        self.metrics_label = QLabel('Pomiary czasu w dzienniku')
+        self.metrics_label.setToolTip('Na końcu wyszukiwania zapisuje w dzienniku podsumowanie czasów pobierania i przetwarzania stron')
+        self.metrics = QCheckBox()
+        self.metrics.setChecked(self.prefs['metrics'])
+        self.metrics_label.setBuddy(self.metrics)
+        self.l.addRow(self.metrics_label, self.metrics)
+
+        self.metrics_file_label = QLabel('Plik z pomiarami (JSON)')
+        self.metrics_file_label.setToolTip('Ścieżka pliku, do którego dopisywane są podsumowania pomiarów, puste pole wyłącza zapis')
+        self.metrics_file = QLineEdit(self)
+        self.metrics_file.setText(self.prefs['metrics_file'])
+        self.metrics_file_label.setBuddy(self.metrics_file)
+        self.l.addRow(self.metrics_file_label, self.metrics_file)
+
+        self.clear_cache_button = QPushButton('Wyczyść pamięć podręczną')
+        self.clear_cache_button.clicked.connect(self.clear_cache)
+        self.l.addRow(self.clear_cache_button)
+
         # metadata settings
-        if 'title' in PREFS.defaults:
+        if 'title' in self.prefs.defaults:
             self.title = QCheckBox('Tytuł')
-            self.title.setChecked(PREFS['title'])
+            self.title.setChecked(self.prefs['title'])
             self.l2.addWidget(self.title)
 
-        if 'authors' in PREFS.defaults:
+        if 'authors' in self.prefs.defaults:
             self.authors = QCheckBox('Autorzy')
-            self.authors.setChecked(PREFS['authors'])
+            self.authors.setChecked(self.prefs['authors'])
             self.l2.addWidget(self.authors)
 
-        if 'pubdate' in PREFS.defaults:
+        if 'pubdate' in self.prefs.defaults:
             self.pubdate = QCheckBox('Data wydania')
-            self.pubdate.setChecked(PREFS['pubdate'])
+            self.pubdate.setChecked(self.prefs['pubdate'])
             self.l2.addWidget(self.pubdate)
 
-        if 'publisher' in PREFS.defaults:
+        if 'publisher' in self.prefs.defaults:
             self.publisher = QCheckBox('Wydawca')
-            self.publisher.setChecked(PREFS['publisher'])
+            self.publisher.setChecked(self.prefs['publisher'])
             self.l2.addWidget(self.publisher)
 
-        if 'isbn' in PREFS.defaults:
+        if 'isbn' in self.prefs.defaults:
             self.isbn = QCheckBox('ISBN')
-            self.isbn.setChecked(PREFS['isbn'])
+            self.isbn.setChecked(self.prefs['isbn'])
             self.l2.addWidget(self.isbn)
 
-        if 'comments' in PREFS.defaults:
+        if 'comments' in self.prefs.defaults:
             self.comments = QCheckBox('Opis')
-            self.comments.setChecked(PREFS['comments'])
+            self.comments.setChecked(self.prefs['comments'])
             self.l2.addWidget(self.comments)
 
-        if 'languages' in PREFS.defaults:
+        if 'languages' in self.prefs.defaults:
             self.languages = QCheckBox('Języki')
-            self.languages.setChecked(PREFS['languages'])
+            self.languages.setChecked(self.prefs['languages'])
             self.l2.addWidget(self.languages)
 
-        if 'rating' in PREFS.defaults:
+        if 'rating' in self.prefs.defaults:
             self.rating = QCheckBox('Ocena')
-            self.rating.setChecked(PREFS['rating'])
+            self.rating.setChecked(self.prefs['rating'])
             self.l2.addWidget(self.rating)
 
-        if 'tags' in PREFS.defaults:
+        if 'tags' in self.prefs.defaults:
             self.tags = QCheckBox('Etykiety (tagi)')
-            self.tags.setChecked(PREFS['tags'])
+            self.tags.setChecked(self.prefs['tags'])
             self.l2.addWidget(self.tags)
 
-        if 'series' in PREFS.defaults:
+        if 'series' in self.prefs.defaults:
             self.series = QCheckBox('Cykle')
-            self.series.setChecked(PREFS['series'])
+            self.series.setChecked(self.prefs['series'])
             self.l2.addWidget(self.series)
 
-        if 'identifier' in PREFS.defaults:
+        if 'identifier' in self.prefs.defaults:
             self.identifier = QCheckBox('Identyfikator')
-            self.identifier.setChecked(PREFS['identifier'])
+            self.identifier.setChecked(self.prefs['identifier'])
             self.l2.addWidget(self.identifier)
 
         # custom metadata
-        if 'translators' in PREFS.defaults:
+        if 'translators' in self.prefs.defaults:
             self.translators = QCheckBox('Tłumaczenie')
-            self.translators.setChecked(PREFS['translators'])
+            self.translators.setChecked(self.prefs['translators'])
             self.l3.addWidget(self.translators)
 
-        if 'original_title' in PREFS.defaults:
+        if 'original_title' in self.prefs.defaults:
             self.original_title = QCheckBox('Tytuł oryginału')
-            self.original_title.setChecked(PREFS['original_title'])
+            self.original_title.setChecked(self.prefs['original_title'])
             self.l3.addWidget(self.original_title)
 
-        if 'categories' in PREFS.defaults:
+        if 'categories' in self.prefs.defaults:
             self.categories = QCheckBox('Kategorie')
-            self.categories.setChecked(PREFS['categories'])
+            self.categories.setChecked(self.prefs['categories'])
             self.l3.addWidget(self.categories)
 
-        if 'genres' in PREFS.defaults:
+        if 'genres' in self.prefs.defaults:
             self.genres = QCheckBox('Gatunki')
-            self.genres.setChecked(PREFS['genres'])
+            self.genres.setChecked(self.prefs['genres'])
             self.l3.addWidget(self.genres)
 
         self.group_box.setLayout(self.l)
@@ -171,50 +294,74 @@ pierwszy wynik może być niepoprawny')
         self.setLayout(self.main_layout)
 
     def save_settings(self):
-        PREFS['max_results'] = int(self.max_results.text())
-        PREFS['authors_search'] = self.authors_search.isChecked()
-        PREFS['only_first_author'] = self.only_first_author.isChecked()
-        PREFS['covers'] = self.covers.isChecked()
-        PREFS['max_covers'] = int(self.max_covers.text())
-        PREFS['threads'] = self.threads.isChecked()
-        PREFS['max_threads'] = int(self.max_threads.text())
-        PREFS['thread_delay'] = float(self.thread_delay.text().replace(',', '.'))
+        self.prefs['max_results'] = int(self.max_results.text())
+        self.prefs['authors_search'] = self.authors_search.isChecked()
+        self.prefs['only_first_author'] = self.only_first_author.isChecked()
+        self.prefs['covers'] = self.covers.isChecked()
+        self.prefs['max_covers'] = int(self.max_covers.text())
+        self.prefs['cover_probe'] = self.cover_probe.isChecked()
+        self.prefs['max_cover_downloads'] = int(self.max_cover_downloads.text())
+        self.prefs['cover_prefetch'] = self.cover_prefetch.isChecked()
+        self.prefs['threads'] = self.threads.isChecked()
+        self.prefs['max_threads'] = int(self.max_threads.text())
+        self.prefs['thread_delay'] = float(self.thread_delay.text().replace(',', '.'))
+        self.prefs['async_backend'] = self.async_backend.isChecked()
+        self.prefs['rate_limit'] = float(self.rate_limit.text().replace(',', '.'))
+        self.prefs['rate_burst'] = int(self.rate_burst.text())
+        self.prefs['max_retries'] = int(self.max_retries.text())
+        self.prefs['retry_backoff'] = float(self.retry_backoff.text().replace(',', '.'))
+        self.prefs['cache'] = self.cache.isChecked()
+        self.prefs['cache_ttl'] = int(self.cache_ttl.text())
+        self.prefs['cache_max_size'] = int(self.cache_max_size.text())
+        self.prefs['search_cache_ttl'] = int(self.search_cache_ttl.text())
+        self.prefs['search_cache_miss_ttl'] = int(self.search_cache_miss_ttl.text())
+        self.prefs['metrics'] = self.metrics.isChecked()
+        self.prefs['metrics_file'] = self.metrics_file.text().strip()
 
         # metadata settings
-        if 'title' in PREFS.defaults:
-            PREFS['title'] = self.title.isChecked()
-        if 'authors' in PREFS.defaults:
-            PREFS['authors'] = self.authors.isChecked()
-        if 'pubdate' in PREFS.defaults:
-            PREFS['pubdate'] = self.pubdate.isChecked()
-        if 'publisher' in PREFS.defaults:
-            PREFS['publisher'] = self.publisher.isChecked()
-        if 'isbn' in PREFS.defaults:
-            PREFS['isbn'] = self.isbn.isChecked()
-        if 'comments' in PREFS.defaults:
-            PREFS['comments'] = self.comments.isChecked()
-        if 'languages' in PREFS.defaults:
-            PREFS['languages'] = self.languages.isChecked()
-        if 'rating' in PREFS.defaults:
-            PREFS['rating'] = self.rating.isChecked()
-        if 'tags' in PREFS.defaults:
-            PREFS['tags'] = self.tags.isChecked()
-        if 'series' in PREFS.defaults:
-            PREFS['series'] = self.series.isChecked()
-        if 'identifier' in PREFS.defaults:
-            PREFS['identifier'] = self.identifier.isChecked()
+        if 'title' in self.prefs.defaults:
+            self.prefs['title'] = self.title.isChecked()
+        if 'authors' in self.prefs.defaults:
+            self.prefs['authors'] = self.authors.isChecked()
+        if 'pubdate' in self.prefs.defaults:
+            self.prefs['pubdate'] = self.pubdate.isChecked()
+        if 'publisher' in self.prefs.defaults:
+            self.prefs['publisher'] = self.publisher.isChecked()
+        if 'isbn' in self.prefs.defaults:
+            self.prefs['isbn'] = self.isbn.isChecked()
+        if 'comments' in self.prefs.defaults:
+            self.prefs['comments'] = self.comments.isChecked()
+        if 'languages' in self.prefs.defaults:
+            self.prefs['languages'] = self.languages.isChecked()
+        if 'rating' in self.prefs.defaults:
+            self.prefs['rating'] = self.rating.isChecked()
+        if 'tags' in self.prefs.defaults:
+            self.prefs['tags'] = self.tags.isChecked()
+        if 'series' in self.prefs.defaults:
+            self.prefs['series'] = self.series.isChecked()
+        if 'identifier' in self.prefs.defaults:
+            self.prefs['identifier'] = self.identifier.isChecked()
 
         # custom metadata settings
-        if 'translators' in PREFS.defaults:
-            PREFS['translators'] = self.translators.isChecked()
-        if 'original_title' in PREFS.defaults:
-            PREFS['original_title'] = self.original_title.isChecked()
-        if 'categories' in PREFS.defaults:
-            PREFS['categories'] = self.categories.isChecked()
-        if 'genres' in PREFS.defaults:
-            PREFS['genres'] = self.genres.isChecked()
-
-        return PREFS
+        if 'translators' in self.prefs.defaults:
+            self.prefs['translators'] = self.translators.isChecked()
+        if 'original_title' in self.prefs.defaults:
+            self.prefs['original_title'] = self.original_title.isChecked()
+        if 'categories' in self.prefs.defaults:
+            self.prefs['categories'] = self.categories.isChecked()
+        if 'genres' in self.prefs.defaults:
+            self.prefs['genres'] = self.genres.isChecked()
+
+        invalidate_settings()
+        return self.prefs
+
+    def clear_cache(self):
+        get_response_cache().clear()
+        get_search_cache().clear()
+        get_book_cache().clear()
+        if self.plugin is not None:
+            self.plugin.clear_memory_caches()
+        self.clear_cache_button.setText('Wyczyszczono pamięć podręczną')
 
 
 if __name__ == '__main__':
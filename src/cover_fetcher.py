@@ -0,0 +1,301 @@
+import http.client
+import re
+import socket
+import threading
+import urllib.error
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, wait, FIRST_COMPLETED
+
+from calibre.utils.imghdr import identify
+
+from .plugin_meta import GOOD_COVER_MIN_SIZE, COVER_PROBE_SIZE
+from .throttle import Throttle
+from .deadline import Deadline
+from .transport import get_transport
+from .response_cache import get_response_cache
+from .cache_database import call_cache
+from .metrics import get_metrics
+from .single_flight import SingleFlight
+
+# dimensions read from image header (None if unknown), size of whole image and its data if it was downloaded whole
+CoverProbe = namedtuple('CoverProbe', ('url', 'width', 'height', 'size', 'cdata'))
+
+
+class CoverFetcher:
+    """Downloads covers using bounded pool of threads and shared keep-alive transport."""
+
+    ABORT_POLL_INTERVAL = 0.2
+    PROBE_HEADERS = {
+        'Range': 'bytes=0-{}'.format(COVER_PROBE_SIZE - 1),
+        'Accept-Encoding': 'identity',
+    }
+    # concurrent downloads of the same cover, shared by all fetchers including background prefetch
+    DOWNLOAD_FLIGHTS = SingleFlight()
+
+    def __init__(self, plugin, log, timeout, settings=None, deadline=None):
+        self.plugin = plugin
+        self.settings = settings or plugin.settings_snapshot()
+        self.log = log
+        self.timeout = timeout
+        self.deadline = deadline or Deadline(timeout)
+        self.transport = get_transport(self.settings)
+        self.throttle = Throttle(self.settings.thread_delay)
+        self.metrics = get_metrics(self.settings, 'download_cover')
+        self.cache = get_response_cache(self.settings) if self.settings.cache else None
+        self.downloaded = {}  # cover data got while probing or from cache, by url
+
+    def run(self, urls, result_queue, abort, get_best_cover=False):
+        """
+        Puts downloaded covers in result_queue as soon as they arrive. With cover_probe only best covers
+        (just one in get_best_cover mode) are downloaded. Otherwise in get_best_cover mode remaining
+        downloads are cancelled once cover of at least GOOD_COVER_MIN_SIZE arrives.
+        """
+        try:
+            if self.settings.cover_probe and len(urls) > 1:
+                urls = self.choose(urls, abort, 1 if get_best_cover else max(self.settings.max_cover_downloads, 1))
+            self.download_all(urls, result_queue, abort, get_best_cover)
+        finally:
+            self.metrics.report(self.log, self.settings.metrics_file)
+
+    def prefetch(self, urls):
+        """Downloads best cover into response cache, so that following download_cover does not wait for it."""
+
+        try:
+            if self.settings.cover_probe and len(urls) > 1:
+                urls = self.choose(urls, None, 1)
+            for url in urls[:1]:
+                if url not in self.downloaded:
+                    self.download(url)
+        except Exception:
+            self.log.exception('ERROR: Cover prefetch failed')
+        finally:
+            self.metrics.report(self.log, self.settings.metrics_file)
+
+    def download_all(self, urls, result_queue, abort, get_best_cover):
+        executor = self.create_executor(urls)
+        responses = set()
+        if self.transport.is_async:
+            # all covers are downloaded at once on event loop, ones downloaded by other thread (e.g. prefetch)
+            # are awaited in pool
+            futures = {}
+            for url in urls:
+                if url in self.DOWNLOAD_FLIGHTS:
+                    futures[executor.submit(self.download_task, url, abort)] = url
+                else:
+                    future = self.submit_download(url)
+                    responses.add(future)
+                    futures[future] = url
+        else:
+            futures = {executor.submit(self.download_task, url, abort): url for url in urls}
+        try:
+            pending = set(futures)
+            while pending and not abort.is_set():
+                if self.deadline.expired():
+                    self.log.warn('WARN: Time budget exhausted, cancelling remaining cover downloads')
+                    return
+                done, pending = wait(pending, timeout=self.ABORT_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in responses:
+                        cdata = self.download(futures[future], future)
+                    else:
+                        cdata = future.result()
+                    if not cdata:
+                        continue
+
+                    result_queue.put((self.plugin, cdata))
+                    if get_best_cover and self.is_good_enough(cdata):
+                        self.log.info('INFO: Found good enough cover, cancelling remaining downloads')
+                        return
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def submit_download(self, url):
+        """Requests cover on asyncio transport, returns already completed future if cover is at hand."""
+
+        cdata = self.downloaded.get(url) or self.get_cached(url)
+        if cdata:
+            self.downloaded[url] = cdata
+            future = Future()
+            future.set_result(None)
+            return future
+
+        return self.transport.submit(url, timeout=self.timeout, metrics=self.metrics, deadline=self.deadline)
+
+    def create_executor(self, urls):
+        max_threads = self.settings.max_threads if self.settings.threads else 1
+        return ThreadPoolExecutor(max_workers=max(min(max_threads, len(urls)), 1))
+
+    def choose(self, urls, abort, count):
+        """Probes covers concurrently and returns urls of count best ones, largest first."""
+
+        executor = self.create_executor(urls)
+        futures = [executor.submit(self.probe, url) for url in urls]
+        try:
+            pending = set(futures)
+            while pending and not (abort and abort.is_set()) and not self.deadline.expired():
+                _, pending = wait(pending, timeout=self.ABORT_POLL_INTERVAL)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+        probes = [future.result() for future in futures if future.done() and not future.cancelled()]
+        if not probes:
+            return urls[:count]
+
+        probes.sort(key=lambda probe: ((probe.width or 0) * (probe.height or 0), probe.size or 0), reverse=True)
+        for probe in probes:
+            self.log.info('INFO: Cover {}x{}, {} bytes: {}'.format(probe.width, probe.height, probe.size, probe.url))
+            if probe.cdata:
+                self.downloaded[probe.url] = probe.cdata
+        chosen = [probe.url for probe in probes[:count]]
+        self.metrics.count('covers_skipped', len(urls) - len(chosen))
+        return chosen
+
+    def probe(self, url):
+        """Returns CoverProbe read from cached cover or from beginning of image requested with Range header."""
+
+        cdata = self.get_cached(url)
+        if cdata:
+            return CoverProbe(url, *self.get_dimensions(cdata), len(cdata), cdata)
+
+        self.log.info('INFO: Probing cover: {}'.format(url))
+        self.metrics.count('cover_probes')
+        try:
+            resp = self.transport.request(url, self.PROBE_HEADERS, timeout=self.timeout, metrics=self.metrics,
+                                          deadline=self.deadline)
+            with resp:
+                data = resp.read()
+        except socket.timeout:
+            self.log.exception('ERROR: Cover probe failed, request timed out: {}'.format(url))
+            return CoverProbe(url, None, None, None, None)
+        except (urllib.error.URLError, http.client.HTTPException):
+            self.log.exception('ERROR: Cover probe failed: {}'.format(url))
+            return CoverProbe(url, None, None, None, None)
+
+        if resp.status == 200 and data:
+            # server ignored Range, whole image is already downloaded
+            self.store(url, resp, data)
+            return CoverProbe(url, *self.get_dimensions(data), len(data), data)
+        if resp.status != 206:
+            self.log.error('ERROR: Cover probe failed, HTTP {}: {}'.format(resp.status, url))
+            return CoverProbe(url, None, None, None, None)
+
+        match = re.search(r'/(\d+)\s*$', resp.headers.get('Content-Range', ''))
+        size = int(match.group(1)) if match else None
+        if data and size == len(data):
+            # image is smaller than probe, range already holds all of it
+            self.store(url, resp, data)
+            return CoverProbe(url, *self.get_dimensions(data), size, data)
+        return CoverProbe(url, *self.get_dimensions(data), size, None)
+
+    def download_task(self, url, abort):
+        if abort.is_set():
+            return None
+        if url not in self.downloaded and not self.throttle.wait(self.deadline):
+            return None
+        if abort.is_set() or self.deadline.expired():
+            return None
+
+        return self.download(url)
+
+    def download(self, url, response_future=None):
+        """
+        Returns cover image data or None, served from probe or response cache if possible.
+        Response may be already requested on asyncio transport.
+        """
+
+        cdata = self.downloaded.get(url) or self.get_cached(url)
+        if cdata:
+            self.log.info('INFO: Cover already downloaded: {}'.format(url))
+            return cdata
+
+        try:
+            cdata, shared = self.DOWNLOAD_FLIGHTS.do(url, self.fetch, url, response_future, deadline=self.deadline)
+        except TimeoutError:
+            self.log.warn('WARN: Gave up waiting for cover downloaded by other thread: {}'.format(url))
+            return None
+        if shared:
+            self.log.info('INFO: Cover downloaded by other thread: {}'.format(url))
+            self.metrics.count('shared_fetches')
+
+        return cdata
+
+    def fetch(self, url, response_future=None):
+        """Returns cover image data downloaded from url (or read from already requested response) or None."""
+
+        self.log.info('INFO: Downloading cover: {}'.format(url))
+        try:
+            if response_future:
+                resp = response_future.result()
+            else:
+                resp = self.transport.request(url, timeout=self.timeout, metrics=self.metrics, deadline=self.deadline)
+            with resp:
+                cdata = resp.read()
+        except socket.timeout:
+            self.log.exception('ERROR: Cover download failed, request timed out: {}'.format(url))
+            return None
+        except (urllib.error.URLError, http.client.HTTPException):
+            self.log.exception('ERROR: Cover download failed: {}'.format(url))
+            return None
+
+        if resp.status != 200 or not cdata:
+            self.log.error('ERROR: Cover download failed, HTTP {}: {}'.format(resp.status, url))
+            return None
+
+        self.store(url, resp, cdata)
+        return cdata
+
+    def get_cached(self, url):
+        if not self.cache:
+            return None
+
+        entry = call_cache(self.log, self.cache.get, url)
+        if entry and entry.complete and self.cache.is_fresh(entry):
+            self.metrics.count('cache_hits')
+            return entry.body
+
+        return None
+
+    def store(self, url, resp, cdata):
+        if self.cache:
+            call_cache(self.log, self.cache.put, url, cdata, resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+
+    def get_dimensions(self, cdata):
+        """Returns width and height of image, None if they could not be read."""
+
+        try:
+            _, width, height = identify(cdata)
+        except Exception:
+            self.log.exception('ERROR: Could not read cover dimensions')
+            return None, None
+
+        if width < 0 or height < 0:
+            return None, None
+
+        return width, height
+
+    def is_good_enough(self, cdata):
+        width, height = self.get_dimensions(cdata)
+        if width is None:
+            return False
+
+        min_width, min_height = GOOD_COVER_MIN_SIZE
+        return width >= min_width and height >= min_height
+
+
+_PREFETCH_EXECUTOR = None
+_PREFETCH_LOCK = threading.Lock()
+
+
+def prefetch_covers(plugin, log, urls, timeout, settings):
+    """Starts downloading best of given covers into response cache in background thread."""
+
+    global _PREFETCH_EXECUTOR
+    with _PREFETCH_LOCK:
+        if _PREFETCH_EXECUTOR is None:
+            _PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='biblionetka-covers')
+
+    return _PREFETCH_EXECUTOR.submit(CoverFetcher(plugin, log, timeout, settings).prefetch, urls)
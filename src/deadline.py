@@ -0,0 +1,37 @@
+import time
+
+
+class Deadline:
+    """Total time budget of a run, per request timeouts shrink as it runs out."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires = time.monotonic() + budget if budget else None
+
+    def remaining(self):
+        """Returns seconds left or None if there is no budget."""
+
+        if self.expires is None:
+            return None
+
+        return max(self.expires - time.monotonic(), 0)
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def timeout(self, request_timeout):
+        """Returns request timeout not exceeding time left."""
+
+        remaining = self.remaining()
+        if remaining is None:
+            return request_timeout
+        if request_timeout is None:
+            return remaining
+
+        return min(request_timeout, remaining)
+
+    def allows(self, seconds):
+        """Checks if waiting given number of seconds still fits in the budget."""
+
+        remaining = self.remaining()
+        return remaining is None or seconds < remaining
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory mapping with bounded number of entries, least recently used ones are evicted first.
+    With ttl (in seconds) entries expire that long after being stored.
+    """
+
+    def __init__(self, max_size, ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if not self.is_valid(key):
+                return default
+            self.data.move_to_end(key)
+            return self.data[key][0]
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def is_valid(self, key):
+        """Checks if key is stored and not expired, removing expired entry. Call with lock held."""
+
+        if key not in self.data:
+            return False
+
+        expires = self.data[key][1]
+        if expires is not None and time.monotonic() >= expires:
+            del self.data[key]
+            return False
+
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.is_valid(key)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.data)
@@ -0,0 +1,98 @@
+import contextlib
+import json
+import threading
+import time
+from collections import defaultdict
+
+
+class Metrics:
+    """Collects timings (per phase, e.g. dns, connect, first_byte, body, parse) and counters of single run."""
+
+    enabled = True
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.timings = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timings[name] += seconds
+            self.calls[name] += 1
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def timed(self, name, function):
+        """Returns function wrapped so that its calls are recorded as phase of given name."""
+
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    def summary(self):
+        with self.lock:
+            return {
+                'name': self.name,
+                'total': round(time.perf_counter() - self.start, 4),
+                'phases': {name: {'time': round(seconds, 4), 'calls': self.calls[name]}
+                           for name, seconds in sorted(self.timings.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def report(self, log, path=None):
+        """Logs summary as single JSON line, appending it to file at path as well if given."""
+
+        line = json.dumps(self.summary(), sort_keys=True)
+        log.info('METRICS: {}'.format(line))
+        if path:
+            try:
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            except OSError:
+                log.exception('ERROR: Could not write metrics to {}'.format(path))
+
+
+class NullMetrics:
+    """Metrics doing nothing, used when instrumentation is disabled."""
+
+    enabled = False
+    NULL_CONTEXT = contextlib.nullcontext()
+
+    def phase(self, name):
+        return self.NULL_CONTEXT
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def timed(self, name, function):
+        return function
+
+    def report(self, log, path=None):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def get_metrics(settings, name):
+    """Returns new Metrics if instrumentation is enabled in settings, otherwise shared NullMetrics."""
+
+    return Metrics(name) if settings.metrics else NULL_METRICS
@@ -1,14 +1,32 @@
-import http.cookiejar
-import urllib.request, urllib.error, urllib.parse
+import http.client
+import urllib.error, urllib.parse
 import socket
+import io
+import lxml.etree
 import lxml.html
 import copy
+import re
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+from collections import namedtuple
 from typing import Tuple, Optional
 
 from .utils import IDENTIFIER
+from .response_cache import get_response_cache, CachingReader
+from .cache_database import call_cache
+from .search_cache import get_search_cache
+from .book_cache import get_book_cache
+from .transport import get_transport
+from .throttle import Throttle
+from .deadline import Deadline
+from .single_flight import SingleFlight
+from .metrics import get_metrics
 
 from calibre.ebooks.metadata.book.base import Metadata
 
+FieldPlan = namedtuple('FieldPlan', ('fields', 'extractors'))
+# book found on search page, title and authors come from result snippet and may be None if not available
+SearchResult = namedtuple('SearchResult', ('url', 'title', 'authors'))
+
 
 class ParserBase:
     names_split_delimiter = ', '
@@ -16,53 +34,305 @@ class ParserBase:
     url_scheme_title = None  # need to be set
     url_scheme_title_authors = None # need to be set
     book_tag_xpath = None
+    # selector name to XPath expression, compiled once at class creation, use with select()
+    SELECTORS = {}
+    compiled_selectors = {}
     SKIP_AUTHORS = ('Unknown', 'Nieznany')
-
-    def __init__(self, plugin, log, timeout):
+    # metadata fields in order of extraction along with methods extracting them
+    FIELD_EXTRACTORS = (
+        ('title', 'parse_title'),
+        ('authors', 'parse_authors'),
+        ('languages', 'parse_languages'),
+        ('rating', 'parse_rating'),
+        ('tags', 'parse_tags'),
+        ('identifier', 'parse_identifier'),
+        ('pubdate', 'parse_pubdate'),
+        ('covers', 'parse_covers'),
+        ('series', 'parse_series'),
+        ('translators', 'parse_translators'),
+        ('original_title', 'parse_original_title'),
+        ('categories', 'parse_categories'),
+        ('genres', 'parse_genres'),
+        ('comments', 'parse_comments'),
+    )
+    # fields which are only embedded in comments
+    COMMENT_ONLY_FIELDS = ('translators', 'original_title', 'categories', 'genres')
+    # fields not listed in plugin's touched_fields, but still used
+    UNTOUCHED_FIELDS = ('covers', 'translators', 'original_title', 'categories', 'genres')
+    ABORT_POLL_INTERVAL = 0.2
+    # selectors of all elements field extractors read from book page (including covers and rating, if they are
+    # outside of book tag), its download stops once they are parsed; empty disables partial parsing
+    partial_parse_selectors = ()
+    PARTIAL_PARSE_CHUNK_SIZE = 16 * 1024
+    # concurrent downloads of the same page and parsing of the same book page, shared by all parser instances
+    PAGE_FLIGHTS = SingleFlight()
+    BOOK_FLIGHTS = SingleFlight()
+    # low priority fetches (authors search) are skipped once less than this part of time budget is left
+    LOW_PRIORITY_MIN_BUDGET = 0.5
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.compile_selectors()
+
+    @classmethod
+    def compile_selectors(cls):
+        """Compiles SELECTORS (and book_tag_xpath as 'book_tag' selector) into lxml XPath objects."""
+
+        selectors = dict(cls.SELECTORS)
+        if cls.book_tag_xpath and 'book_tag' not in selectors:
+            selectors['book_tag'] = cls.book_tag_xpath
+        cls.compiled_selectors = {name: lxml.etree.XPath(xpath) for name, xpath in selectors.items()}
+
+    def __init__(self, plugin, log, timeout, settings=None, deadline=None):
         self.plugin = plugin
-        self.prefs = plugin.PREFS
+        self.settings = settings or plugin.settings_snapshot()
         self.log = log
         self.timeout = timeout
-        self.cj = http.cookiejar.CookieJar()
+        # timeout is a budget for whole run (possibly shared with cover download), single requests get
+        # at most what is left of it
+        self.deadline = deadline or Deadline(timeout)
+        self.transport = get_transport(self.settings)
+        self.cj = self.transport.cookies
         self.title = ''
         self.authors = []
-        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cj))
-        urllib.request.install_opener(self.opener)
-
-    def run(self, title: str, authors, identifier_url, abort):
-        """Runs parser."""
-        authors_search = self.prefs['authors_search']
-        only_first_author = self.prefs['only_first_author']
-
-        results = []
+        self.throttle = Throttle(self.settings.thread_delay)
+        self.prefetched = {}
+        self.abort = None
+        self.metrics = get_metrics(self.settings, 'identify')
+        self.cache = get_response_cache(self.settings) if self.settings.cache else None
+        self.search_cache = get_search_cache(self.settings) if self.settings.cache else None
+        self.book_cache = get_book_cache(self.settings) if self.settings.cache else None
+        self.field_plan = self.get_field_plan()
+
+    def run(self, title: str, authors, identifier_url, abort, search=True):
+        """
+        Runs parser, yielding Metadata objects as soon as they are parsed. Book page from identifier is parsed
+        first, search pages are fetched only if it fails or more results are needed and search is True.
+        """
+        authors_search = self.settings.authors_search
+        only_first_author = self.settings.only_first_author
+        max_results = self.settings.max_results
+
+        self.abort = abort
+        results_count = 0
         authors = authors or []
         self.authors = copy.copy(authors)
         self.title = title
         authors = [a for a in authors if not a in self.SKIP_AUTHORS]
+
+        if identifier_url:
+            self.log.info('INFO: Parsing book page from identifier')
+            mi = self.parse_book_page(identifier_url)
+            if mi:
+                yield mi
+                results_count += 1
+                if not search or results_count >= max_results:
+                    return
+            else:
+                self.log.warn('WARN: Parsing book page from identifier failed, falling back to search')
+
+            if abort.is_set():
+                return
+
         authors_string = self.get_name_string(authors, only_first_author)
         title_url, authors_url = self.get_search_page_url(title, authors_string)
 
-        self.log.info('INFO: Parsing search page')
-        book_page_urls = self.parse_search_page(title_url, title, authors, only_first_author)
-        if authors_search and len(book_page_urls) < self.prefs['max_results']:
-            book_page_urls.extend(self.parse_search_page(authors_url, title, authors, only_first_author))
+        if self.deadline.expired():
+            self.log.warn('WARN: Time budget exhausted, skipped search')
+            return
 
-        if identifier_url:
-            book_page_urls.insert(0, identifier_url)
+        self.log.info('INFO: Parsing search page')
+        search_results = self.search('title', title_url, title, authors, only_first_author)
+        found_count = len({result.url for result in search_results} - {identifier_url})
+        if authors_search and authors_url and results_count + found_count < max_results \
+                and self.has_budget_for('authors search'):
+            search_results.extend(self.search('authors', authors_url, title, authors, only_first_author))
 
         if abort.is_set():
-            return results
+            return
+
+        search_results = [result for result in search_results if result.url != identifier_url]
+        book_page_urls = self.rank_search_results(search_results, title, authors, only_first_author)
+        yield from self.parse_book_pages(book_page_urls[:max_results - results_count], abort)
+
+    def has_budget_for(self, fetch):
+        """Checks if enough of time budget is left for low priority fetch."""
+
+        remaining = self.deadline.remaining()
+        if remaining is None or remaining >= self.deadline.budget * self.LOW_PRIORITY_MIN_BUDGET:
+            return True
+
+        self.log.warn('WARN: Only {:.1f}s of time budget left, skipped {}'.format(remaining, fetch))
+        return False
+
+    def parse_book_pages(self, urls, abort):
+        """Parses book pages, concurrently if enabled, yielding Metadata objects in order of urls."""
+
+        if self.settings.threads and self.settings.max_threads > 1 and len(urls) > 1:
+            yield from self.parse_book_pages_concurrently(urls, abort)
+            return
+
+        for url in urls:
+            if self.deadline.expired():
+                self.log.warn('WARN: Time budget exhausted, returning partial results')
+                return
 
-        for url in book_page_urls[:self.prefs['max_results']]:
             mi = self.parse_book_page(url)
 
             if mi:
-                results.append(mi)
+                yield mi
 
             if abort.is_set():
-                return results
+                return
+
+    def parse_book_pages_concurrently(self, urls, abort):
+        """Parses book pages using bounded pool of threads, yielding Metadata objects in order of urls."""
+
+        max_workers = min(self.settings.max_threads, len(urls))
+        self.log.info('INFO: Parsing {} book pages using {} threads'.format(len(urls), max_workers))
+        if self.transport.is_async:
+            # all pages are downloaded at once on event loop, threads only parse them
+            self.prefetch_pages(urls, partial_ok=bool(self.partial_parse_selectors))
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [executor.submit(self.parse_book_page_task, url, abort) for url in urls]
+        try:
+            for future in futures:
+                while not future.done() and not abort.is_set() and not self.deadline.expired():
+                    wait([future], timeout=self.ABORT_POLL_INTERVAL)
+                if abort.is_set():
+                    self.log.info('INFO: Aborted, cancelled pending book pages')
+                    return
+                if not future.done():
+                    self.log.warn('WARN: Time budget exhausted, returning partial results')
+                    return
+
+                mi = future.result()
+                if mi:
+                    yield mi
+        finally:
+            for future in futures:
+                future.cancel()
+            for future in self.prefetched.values():
+                future.cancel()
+            self.prefetched.clear()
+            executor.shutdown(wait=False)
+
+    def parse_book_page_task(self, url, abort):
+        """Parses book page in worker thread, unless aborted in the meantime."""
+
+        if abort.is_set():
+            return None
+
+        return self.parse_book_page(url)
+
+    def search(self, kind, url, title, authors, only_first_author):
+        """Returns list of SearchResult from search page, memoized in search cache if enabled."""
+
+        if not self.search_cache:
+            with self.metrics.phase('parse_search_page'):
+                return self.get_search_results(self.parse_search_page(url, title, authors, only_first_author))
+
+        key = self.get_search_key(kind, title, authors, only_first_author)
+        cached = call_cache(self.log, self.search_cache.get, key)
+        if cached is None and not self.claim_fetch('search|' + key):
+            cached = call_cache(self.log, self.search_cache.get, key)
+        if cached is not None:
+            self.log.info('INFO: Search results loaded from cache: {}'.format(key))
+            self.metrics.count('search_cache_hits')
+            return self.get_search_results(cached)
+
+        try:
+            with self.metrics.phase('parse_search_page'):
+                results = self.parse_search_page(url, title, authors, only_first_author)
+            if results is None:
+                return []
+
+            results = self.get_search_results(results)
+            call_cache(self.log, self.search_cache.put, key, results)
+            return results
+        finally:
+            call_cache(self.log, self.book_cache.release, 'search|' + key)
+
+    def claim_fetch(self, key):
+        """
+        Claims fetching key among calibre worker processes and threads. If other one fetches it already,
+        waits for it to finish (within time budget) and returns False, so its result can be read from cache.
+        """
+
+        # lease can not be taken if cache fails, fetching goes on as if it was taken
+        if call_cache(self.log, self.book_cache.claim, key, self.timeout, default=True):
+            return True
+
+        self.log.info('INFO: Waiting for other worker fetching: {}'.format(key))
+        self.metrics.count('fetches_awaited')
+        with self.metrics.phase('fetch_wait'):
+            call_cache(self.log, self.book_cache.wait_for_release, key, self.deadline, default=False)
+        return False
+
+    def get_search_results(self, results):
+        """
+        Returns list of SearchResult from parse_search_page output (or its cached copy),
+        which may contain plain book page urls or (url, title, authors) entries with snippet data.
+        """
+
+        search_results = []
+        for result in results or []:
+            if isinstance(result, str):
+                search_results.append(SearchResult(result, None, None))
+            else:
+                search_results.append(SearchResult(*result))
+
+        return search_results
+
+    def rank_search_results(self, results, title, authors, only_first_author=False):
+        """
+        Returns distinct book page urls ordered by match of result snippets with searched title and authors.
+        Results without snippet data score zero, ties keep search page order.
+        """
+
+        title_tokens = set(self.get_title_tokens(title))
+        authors_tokens = set(self.get_name_tokens(authors, only_first_author))
+        scores = {}
+        for result in results:
+            score = self.score_search_result(result, title_tokens, authors_tokens)
+            if result.url in scores:
+                self.metrics.count('duplicate_search_results')
+                scores[result.url] = max(scores[result.url], score)
+            else:
+                scores[result.url] = score
+
+        urls = sorted(scores, key=lambda url: -scores[url])
+        self.log.debug('DEBUG: Ranked search results: {}'.format(
+            ', '.join('{} ({:.2f})'.format(url, scores[url]) for url in urls)))
+        return urls
+
+    def score_search_result(self, result, title_tokens, authors_tokens):
+        """
+        Returns sum of title match and share of searched authors tokens found in result snippet. Title match is F1
+        of tokens, so that extra words (e.g. volume of other edition) lower it. Extra authors do not, as snippets
+        list co-authors which search may omit.
+        """
+
+        score = 0.0
+        if result.title and title_tokens:
+            result_tokens = set(self.get_title_tokens(result.title))
+            score += 2 * len(title_tokens & result_tokens) / (len(title_tokens) + len(result_tokens))
+        if result.authors and authors_tokens:
+            score += len(authors_tokens & set(self.get_name_tokens(result.authors))) / len(authors_tokens)
+
+        return score
+
+    def get_title_tokens(self, title):
+        """Returns list of lowercase words from title."""
 
-        return results
+        return [token for token in re.findall(r'\w+', (title or '').lower()) if len(token) > 1]
+
+    def get_search_key(self, kind, title, authors, only_first_author=False):
+        """Returns search cache key built from normalised title and author tokens."""
+
+        title_tokens = ' '.join(title.lower().split())
+        authors_tokens = ' '.join(sorted(self.get_name_tokens(authors, only_first_author)))
+        return '{}|{}|{}'.format(kind, title_tokens, authors_tokens)
 
     def get_search_page_url(self, title: str, authors_string: Optional[str], with_authors: bool=False) -> Tuple[str, str]:
         """Returns url to page with search results for given book and author"""
@@ -73,6 +343,76 @@ class ParserBase:
         return (title_url, author_url)
 
     def parse_book_page(self, url):
+        """Returns Metadata of book page, parsed once for all threads asking for it at the same time."""
+
+        try:
+            # callers with other field plan get other Metadata, like from memory and shared cache
+            mi, shared = self.BOOK_FLIGHTS.do((url, self.field_plan.fields), self.load_book_page, url,
+                                              deadline=self.deadline, abort=self.abort)
+        except TimeoutError:
+            self.log.warn('WARN: Gave up waiting for book page parsed by other thread: {}'.format(url))
+            return None
+        if shared:
+            self.log.info('INFO: Book page parsed by other thread: {}'.format(url))
+            self.metrics.count('shared_fetches')
+        if mi is None:
+            return None
+
+        # each caller gets own copy, as it is modified further by calibre and result may be shared
+        return self.apply_query(mi.deepcopy())
+
+    def apply_query(self, mi):
+        """
+        Fills title and authors not extracted from book page with searched ones. Parsed Metadata is cached
+        and shared without them, as they differ between callers.
+        """
+
+        fields = self.field_plan.fields
+        if 'title' not in fields:
+            mi.title = self.title
+        if 'authors' not in fields:
+            mi.authors = list(self.authors)
+
+        return mi
+
+    def load_book_page(self, url):
+        """Returns Metadata of book page, from cache if possible."""
+
+        book = self.get_cached_book(url)
+        if book is None and self.book_cache and not self.claim_fetch(url):
+            book = self.get_cached_book(url)
+        if book is not None:
+            identifier = book.mi.get_identifiers().get(IDENTIFIER)
+            if identifier and book.covers is not None:
+                self.plugin.cache_identifier_to_cover_url(identifier, book.covers)
+            return book.mi
+
+        try:
+            return self.fetch_book_page(url)
+        finally:
+            if self.book_cache:
+                call_cache(self.log, self.book_cache.release, url)
+
+    def get_cached_book(self, url):
+        """Returns CachedBook from memory or, if cache is enabled, from cache shared by worker processes."""
+
+        book = self.plugin.get_cached_book(url, self.field_plan.fields)
+        if book is not None:
+            self.log.info('INFO: Loaded parsed book page from memory: {}'.format(url))
+            self.metrics.count('books_cache_hits')
+            return book
+
+        book = call_cache(self.log, self.book_cache.get, url, self.field_plan.fields) if self.book_cache else None
+        if book is not None:
+            self.log.info('INFO: Loaded parsed book page from cache: {}'.format(url))
+            self.metrics.count('books_cache_hits')
+            self.plugin.cache_book(url, self.field_plan.fields, book.mi, book.covers)
+
+        return book
+
+    def fetch_book_page(self, url):
+        """Downloads and parses book page, storing result in memory and in shared cache if enabled."""
+
         # TODO: Support for login-based rating fetching
         # TODO: Move all parsing logic to methods in order to avoid dangling variables
         # TODO: Saving metadata in custom columns
@@ -81,97 +421,67 @@ class ParserBase:
         # original language, first polish publish date, publisher serie, form
 
         self.log.info('INFO: Downloading book page: {}'.format(url))
-        root_tag = self.get_lxml_root(url)
+        root_tag = self.get_lxml_root(url, partial=True)
 
         if not root_tag:
             return None
 
         book_tag = self.get_book_tag(root_tag)
+        fields = self.field_plan.fields
+        values = {field: extractor(root_tag, book_tag, url) for field, extractor in self.field_plan.extractors}
 
-        if self.prefs['title']:
-            book_title = self.parse_title(root_tag, book_tag, url)
-        else:
-            book_title = self.title
-
-        if self.prefs['authors']:
-            book_authors = self.parse_authors(root_tag, book_tag, url)
-        else:
-            book_authors = self.authors
-
-        mi = Metadata(book_title, book_authors)
+        # title and authors which are not extracted are set by apply_query, they are not cached
+        mi = Metadata(values.get('title'), values.get('authors'))
         additional_meta = {}
 
-        if self.enabled('languages'):
-            languages = self.parse_languages(root_tag, book_tag, url)
-            if languages:
-                mi.languages = languages
+        if values.get('languages'):
+            mi.languages = values['languages']
 
-        if self.enabled('rating'):
-            rating = self.parse_rating(root_tag, book_tag, url)
-            if rating != None:
-                mi.rating = rating
+        if values.get('rating') is not None:
+            mi.rating = values['rating']
 
-        if self.enabled('tags'):
-            tags = self.parse_tags(root_tag, book_tag, url)
-            if tags:
-                mi.tags = tags
+        if values.get('tags'):
+            mi.tags = values['tags']
 
-        if self.enabled('identifier'):
-            identifier = self.parse_identifier(root_tag, book_tag, url)
-            if identifier:
-                mi.set_identifier(IDENTIFIER, identifier)
+        identifier = values.get('identifier')
+        if identifier and 'identifier' in fields:
+            mi.set_identifier(IDENTIFIER, identifier)
 
-        if self.enabled('pubdate'):
-            pubdate = self.parse_pubdate(root_tag, book_tag, url)
-            if pubdate:
-                mi.pubdate = pubdate
+        if values.get('pubdate'):
+            mi.pubdate = values['pubdate']
 
-        if self.enabled('covers'):
-            covers = self.parse_covers(root_tag, book_tag, url)
+        covers = None
+        if 'covers' in fields:
+            # empty list marks book known to have no cover
+            covers = values['covers'] or []
             if covers:
                 mi.has_cover = True
-                self.plugin.cached_identifier_to_cover_url('urls').extend(covers)
-            else:
-                self.plugin.cache_identifier_to_cover_url('nocover', True)
-                # TODO: is this necessary?
-
-        if self.enabled('series'):
-            series = self.parse_series(root_tag, book_tag, url)
-            if series:
-                additional_meta['series'] = [self.get_series_string(name, index) for name, index in series]
-                name, index = series[0]
-                mi.series = name
-                if index is not None:
-                    mi.series_index = index
-
-        if self.enabled('translators'):
-            translators = self.parse_translators(root_tag, book_tag, url)
-            if translators:
-                additional_meta['translators'] = translators
-
-        if self.enabled('original_title'):
-            original_title = self.parse_original_title(root_tag, book_tag, url)
-            if original_title:
-                additional_meta['original_title'] = original_title
-
-        if self.enabled('categories'):
-            categories = self.parse_categories(root_tag, book_tag, url)
-            if categories:
-                additional_meta['categories'] = categories
-
-        if self.enabled('genres'):
-            genres = self.parse_genres(root_tag, book_tag, url)
-            if genres:
-                additional_meta['genres'] = genres
-
-        if self.enabled('comments'):
-            comments = self.parse_comments(root_tag, book_tag, url) or ''
+            if identifier:
+                self.plugin.cache_identifier_to_cover_url(identifier, covers)
+
+        series = values.get('series')
+        if series:
+            additional_meta['series'] = [self.get_series_string(name, index) for name, index in series]
+            name, index = series[0]
+            mi.series = name
+            if index is not None:
+                mi.series_index = index
+
+        for field in self.COMMENT_ONLY_FIELDS:
+            if values.get(field):
+                additional_meta[field] = values[field]
+
+        if 'comments' in fields:
+            comments = values['comments'] or ''
             additional_comments = self.format_additional_comment(additional_meta)
 
             if comments or additional_comments:
                 mi.comments = comments + additional_comments
 
         self.log.info('INFO: Parsing book page completed')
+        self.plugin.cache_book(url, fields, mi, covers)
+        if self.book_cache:
+            call_cache(self.log, self.book_cache.put, url, fields, identifier, mi, covers)
 
         return mi
 
@@ -203,8 +513,8 @@ class ParserBase:
 
     def get_book_tag(self, root_tree):
         book_tag = None
-        if self.book_tag_xpath:
-            match = root_tree.xpath(self.book_tag_xpath)
+        if 'book_tag' in self.compiled_selectors:
+            match = self.select('book_tag', root_tree)
             if len(match) == 1:
                 book_tag = match[0]
             else:
@@ -213,26 +523,222 @@ class ParserBase:
 
         return book_tag
 
-    def get_lxml_root(self, url):
-        """Downloads page from URL and returns LXML root"""
+    def select(self, name, node):
+        """Evaluates precompiled selector of given name against node."""
+
+        return self.compiled_selectors[name](node)
 
-        resp = self.download_page(url)
-        if resp:
-            return lxml.html.parse(resp).getroot()
+    def select_first(self, name, node, default=None):
+        """Returns first result of precompiled selector of given name or default."""
+
+        match = self.compiled_selectors[name](node)
+        return match[0] if match else default
+
+    def get_lxml_root(self, url, partial=False):
+        """
+        Downloads page from URL and returns LXML root. With partial, download stops as soon as all elements
+        matched by partial_parse_selectors are parsed.
+        """
+
+        selectors = [name for name in self.partial_parse_selectors if name in self.compiled_selectors] if partial else []
+        if not selectors:
+            resp = self.download_page(url)
+            if resp:
+                with self.metrics.phase('parse'):
+                    return lxml.html.parse(resp, base_url=url).getroot()
+            return None
+
+        stream = self.open_page(url, partial_ok=True)
+        if stream is None:
+            return None
+
+        # page served from cache or by asyncio transport is already downloaded whole
+        buffered = isinstance(stream, io.BytesIO) or self.transport.is_async
+        try:
+            with stream:
+                return self.parse_partially(stream, url, selectors, buffered)
+        except socket.timeout:
+            self.log.exception('ERROR: Download failed, request timed out: {}'.format(url))
+        except (urllib.error.URLError, http.client.HTTPException, OSError):
+            self.log.exception('ERROR: Download failed: {}'.format(url))
 
         return None
 
+    def parse_partially(self, stream, url, selectors, buffered=False):
+        """
+        Feeds page to incremental parser until elements matched by given selectors are complete.
+        buffered tells that stream is already in memory, so stopping saves only parsing.
+        """
+
+        parser = lxml.etree.HTMLPullParser(events=('end',), base_url=url)
+        parser.set_element_class_lookup(lxml.html.HtmlElementClassLookup())
+        root = None
+        ended = set()
+        size = 0
+
+        while True:
+            chunk = stream.read(self.PARTIAL_PARSE_CHUNK_SIZE)
+            if not chunk:
+                self.log.info('INFO: Download complete: {}'.format(url))
+                break
+
+            size += len(chunk)
+            with self.metrics.phase('parse'):
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    ended.add(element)
+                    root = element.getroottree().getroot()
+                complete = root is not None and self.selectors_complete(root, selectors, ended)
+
+            if complete and buffered:
+                self.log.info('INFO: Stopped parsing after {} bytes, book details parsed: {}'.format(size, url))
+                self.metrics.count('partial_parses')
+                break
+            if complete:
+                self.log.info('INFO: Stopped download after {} bytes, book details parsed: {}'.format(size, url))
+                self.metrics.count('partial_downloads')
+                break
+
+        with self.metrics.phase('parse'):
+            return parser.close()
+
+    def selectors_complete(self, root, selectors, ended):
+        """Checks if all elements matched by selectors are already parsed."""
+
+        for name in selectors:
+            match = self.select(name, root)
+            if not match or not all(element in ended for element in match):
+                return False
+
+        return True
+
     def download_page(self, url):
-        """Downloads page"""
+        """
+        Downloads page, using response cache if enabled, and returns file-like object with its content.
+        Concurrent downloads of the same url are made once.
+        """
 
         try:
-            resp = urllib.request.urlopen(url, timeout=self.timeout)
-            self.log.info('INFO: Download complete: {}'.format(url))
-            return resp
-        except urllib.error.URLError:
+            body, shared = self.PAGE_FLIGHTS.do(url, self.read_page, url, deadline=self.deadline, abort=self.abort)
+        except TimeoutError:
+            self.log.warn('WARN: Gave up waiting for page downloaded by other thread: {}'.format(url))
+            return None
+        if shared:
+            self.log.info('INFO: Page downloaded by other thread: {}'.format(url))
+            self.metrics.count('shared_fetches')
+
+        return io.BytesIO(body) if body is not None else None
+
+    def read_page(self, url):
+        """Returns content of page or None if download failed."""
+
+        stream = self.open_page(url)
+        if stream is None:
+            return None
+
+        try:
+            with stream:
+                body = stream.read()
+        except socket.timeout:
+            self.log.exception('ERROR: Download failed, request timed out: {}'.format(url))
+            return None
+        except (urllib.error.URLError, http.client.HTTPException, OSError):
             self.log.exception('ERROR: Download failed: {}'.format(url))
+            return None
+
+        self.log.info('INFO: Download complete: {}'.format(url))
+        return body
+
+    def get_cache_entry(self, url, partial_ok=False):
+        """Returns cached page, incomplete ones (left by partial parsing) only if partial_ok is set."""
+
+        entry = call_cache(self.log, self.cache.get, url) if self.cache else None
+        if entry and not entry.complete and not partial_ok:
+            return None
+
+        return entry
+
+    def get_conditional_headers(self, entry):
+        """Returns headers allowing server to confirm that cached page has not been modified."""
+
+        headers = {}
+        if entry:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        return headers
+
+    def prefetch_pages(self, urls, partial_ok=False):
+        """
+        Starts downloading pages concurrently on asyncio transport, open_page picks up the responses.
+        Pages of already parsed books are skipped.
+        """
+
+        for url in urls:
+            if self.plugin.get_cached_book(url, self.field_plan.fields) is not None:
+                continue
+            if self.book_cache and call_cache(self.log, self.book_cache.contains, url, self.field_plan.fields,
+                                              default=False):
+                continue
+            entry = self.get_cache_entry(url, partial_ok)
+            if entry and self.cache.is_fresh(entry):
+                continue
+            self.prefetched[url] = self.transport.submit(url, self.get_conditional_headers(entry), timeout=self.timeout,
+                                                         metrics=self.metrics, deadline=self.deadline)
+
+    def open_page(self, url, partial_ok=False):
+        """
+        Returns file-like object streaming page content, served from response cache if possible.
+        Incomplete cached pages (left by partial parsing) are used only if partial_ok is set.
+        """
+
+        entry = self.get_cache_entry(url, partial_ok)
+        if entry and self.cache.is_fresh(entry):
+            self.log.info('INFO: Loaded from cache: {}'.format(url))
+            self.metrics.count('cache_hits')
+            return io.BytesIO(entry.body)
+
+        future = self.prefetched.pop(url, None)
+        if future is None and self.deadline.expired():
+            self.log.warn('WARN: Time budget exhausted, skipped download: {}'.format(url))
+            return None
+        # requests of threads are spaced only if they go to network, prefetched ones are on their way already
+        if future is None and not self.transport.is_async and not self.throttle.wait(self.deadline):
+            self.log.warn('WARN: Time budget exhausted while waiting for request slot, skipped download: {}'.format(url))
+            return None
+        if self.abort is not None and self.abort.is_set():
+            return None
+
+        try:
+            if future:
+                resp = future.result()
+            else:
+                resp = self.transport.request(url, self.get_conditional_headers(entry), timeout=self.timeout,
+                                              metrics=self.metrics, deadline=self.deadline)
         except socket.timeout:
             self.log.exception('ERROR: Download failed, request timed out: {}'.format(url))
+            return None
+        except (urllib.error.URLError, http.client.HTTPException):
+            self.log.exception('ERROR: Download failed: {}'.format(url))
+            return None
+
+        if resp.status == 304 and entry:
+            resp.close()
+            self.log.info('INFO: Not modified, loaded from cache: {}'.format(url))
+            self.metrics.count('cache_revalidations')
+            call_cache(self.log, self.cache.refresh, url)
+            return io.BytesIO(entry.body)
+        if resp.status != 200:
+            resp.close()
+            self.log.error('ERROR: Download failed, HTTP {}: {}'.format(resp.status, url))
+            return None
+
+        if self.cache:
+            return CachingReader(resp, self.cache, url, self.log)
+
+        return resp
 
     def get_names(self, names, name_reversed=False):
         """Returns names list parsed from string."""
@@ -275,19 +781,37 @@ class ParserBase:
 
         return names_string
 
-    def enabled(self, metadata_field):
-        """Checks if given metadata piece is supported and/or enabled"""
-
-        if metadata_field in self.prefs.defaults and self.prefs.get(metadata_field, False):
-            self.log.debug('Writing {} metadata field enabled, processing…'.format(metadata_field))
-            return True
-
-        self.log.debug('Writing {} metadata field disabled, skipping…'.format(metadata_field))
-        return False
+    def get_field_plan(self):
+        """
+        Returns immutable plan of metadata fields to extract, computed once from settings and plugin's touched_fields.
+        Comment-only fields are skipped when comments are disabled, identifier is extracted also for covers.
+        """
+        touched = {field.split(':')[0] for field in self.plugin.touched_fields}
+        fields = set()
+        for field, _ in self.FIELD_EXTRACTORS:
+            if not self.settings.get(field, False):
+                continue
+            if field not in touched and field not in self.UNTOUCHED_FIELDS:
+                continue
+            fields.add(field)
+
+        if 'comments' not in fields:
+            fields.difference_update(self.COMMENT_ONLY_FIELDS)
+
+        extracted_fields = fields | {'identifier'} if 'covers' in fields else fields
+        extractors = tuple((field, self.metrics.timed(method, getattr(self, method)))
+                           for field, method in self.FIELD_EXTRACTORS
+                           if field in extracted_fields)
+        self.log.debug('DEBUG: Extracted metadata fields: {}'.format(', '.join(field for field, _ in extractors)))
+
+        return FieldPlan(frozenset(fields), extractors)
 
     #### METHODS THAT NEED TO BE IMPLEMENTED
     def parse_search_page(self, url, title, authors, with_authors=False, only_first_author=False):
-        """Returns list of book pages url."""
+        """
+        Returns list of book pages url. Items may be SearchResult instead, title and authors read from
+        result snippet are used to rank results before book pages are downloaded.
+        """
 
         raise NotImplementedError
 
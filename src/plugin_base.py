@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 from __future__ import (unicode_literals, division, absolute_import, print_function)
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from calibre.ebooks.metadata.sources.base import Source
 
 from .utils import get_prefs
-from .page_parser import Parser
-from .config_widget import ConfigWidget
+from .settings import get_settings
+from .deadline import Deadline
+from .book_cache import CachedBook, get_book_cache
+from .cache_database import call_cache
+from .lru_cache import LRUCache
 from . import plugin_meta
 
 
@@ -15,12 +18,18 @@ class BaseSource(Source):
     Class main plugin should inherit from providing common implementation.
     Any customization should be done by overriting methods in inherited class or
     via variables in plugin_meta.py
+
+    calibre loads plugin at startup and in every worker process, so modules pulling in lxml, network stack
+    or Qt are imported only on first use.
     """
 
     # custom variables
     IDENTIFIER = plugin_meta.IDENTIFIER
     PREFS = get_prefs()
     BOOK_PAGE_URL_SCHEME = plugin_meta.BOOK_PAGE_URL_SCHEME
+    COVER_URLS = LRUCache(plugin_meta.COVER_URLS_CACHE_SIZE)
+    # parsed book pages, keyed by book page url and extracted fields, cover urls are kept in COVER_URLS by id
+    BOOKS = LRUCache(plugin_meta.BOOKS_CACHE_SIZE, plugin_meta.BOOKS_CACHE_TTL)
 
     # generic plugin options
     name = plugin_meta.name
@@ -51,60 +60,173 @@ class BaseSource(Source):
         else:
             return None
 
-    def identify(self, log, result_queue, abort, title=None, authors=None, identifiers=None, timeout=30):
-        if identifiers is None:
-            identifiers = {}
-
-        self.cache_identifier_to_cover_url('urls', [])
-        parser = Parser(self, log, timeout)
-        identifier_url = None
-        identifier_data = self.get_book_url(identifiers)
+    def get_identifier_url(self, identifiers):
+        identifier_data = self.get_book_url(identifiers or {})
         if identifier_data:
-            identifier_url = identifier_data[2]
+            return identifier_data[2]
+
+        return None
+
+    def settings_snapshot(self):
+        """Returns immutable settings, take it once per identify or batch so that whole run uses the same ones."""
+        return get_settings(self.PREFS)
+
+    def create_parser(self, log, timeout, settings, deadline=None):
+        from .page_parser import Parser
+        return Parser(self, log, timeout, settings, deadline)
+
+    def identify(self, log, result_queue, abort, title=None, authors=None, identifiers=None, timeout=30):
+        settings = self.settings_snapshot()
+        parser = self.create_parser(log, timeout, settings)
+        identifier_url = self.get_identifier_url(identifiers)
+
+        try:
+            prefetch = settings.cover_prefetch and settings.covers and settings.cache
+            for mi in parser.run(title, authors, identifier_url, abort):
+                result_queue.put(mi)
+                if prefetch:
+                    # only top result is likely to be picked, covers of others would waste requests
+                    self.prefetch_covers(log, mi.identifiers, timeout, settings)
+                    prefetch = False
+        finally:
+            parser.metrics.report(log, settings.metrics_file)
+
+    def identify_many(self, log, jobs, abort, timeout=30):
+        """
+        Identifies many books in one call. Jobs are (title, authors, identifiers) tuples,
+        (job index, list of Metadata) pairs are yielded as soon as given book is done.
+        Books with known identifier skip search pages, all jobs share HTTP transport and response cache.
+        """
+        settings = self.settings_snapshot()
+        max_workers = settings.max_threads if settings.threads else 1
+        executor = ThreadPoolExecutor(max_workers=max(max_workers, 1))
+        futures = {executor.submit(self.identify_job, log, job, abort, timeout, settings): index
+                   for index, job in enumerate(jobs)}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+                if abort.is_set():
+                    log.info('INFO: Aborted, cancelling remaining books')
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def identify_job(self, log, job, abort, timeout, settings, deadline=None):
+        title, authors, identifiers = job
+        if abort.is_set():
+            return []
+
+        parser = self.create_parser(log, timeout, settings, deadline)
+        identifier_url = self.get_identifier_url(identifiers)
+        try:
+            return list(parser.run(title, authors, identifier_url, abort, search=not identifier_url))
+        except Exception:
+            log.exception('ERROR: Identifying book failed: {}'.format(title))
+            return []
+        finally:
+            parser.metrics.report(log, settings.metrics_file)
+
+
+    # parsed books related functions
+    def cache_book(self, url, fields, mi, covers):
+        """Stores copy of Metadata parsed from book page with given set of fields, along with its cover urls."""
+        self.BOOKS.put((url, fields), CachedBook(mi.deepcopy(), covers))
+
+    def get_cached_book(self, url, fields):
+        """Returns CachedBook with copy of Metadata recently parsed from book page with the same fields or None."""
+        book = self.BOOKS.get((url, fields))
+        if book is None:
+            return None
 
-        metadata = parser.run(title, authors, identifier_url, abort)
-        for mi in metadata:
-            result_queue.put(mi)
+        return CachedBook(book.mi.deepcopy(), book.covers)
 
+    def clear_memory_caches(self):
+        """Forgets parsed books and cover urls, e.g. after settings changed."""
+        self.BOOKS.clear()
+        self.COVER_URLS.clear()
 
     # cover reladed functions
-    def get_cached_cover_url(self, identifiers):
-        return self.cached_identifier_to_cover_url('urls')
+    def cache_identifier_to_cover_url(self, id_, url):
+        """Stores list of cover urls for given biblionetka id, empty list marks book without cover."""
+        self.COVER_URLS.put(id_, url)
+
+    def cached_identifier_to_cover_url(self, id_):
+        return self.COVER_URLS.get(id_)
+
+    def get_cached_cover_url(self, identifiers, log=None):
+        """
+        Returns list of cover urls, empty list if book has no cover or None if book is not known.
+        calibre calls it without log, failures of shared cache are then written to calibre's default log.
+        """
+        book_id = (identifiers or {}).get(self.IDENTIFIER, None)
+        if not book_id:
+            return None
+
+        urls = self.cached_identifier_to_cover_url(book_id)
+        settings = self.settings_snapshot()
+        if urls is None and settings.cache:
+            # identify might have run in other worker process
+            if log is None:
+                from calibre.utils.logging import default_log as log
+            urls = call_cache(log, get_book_cache(settings).get_covers, book_id)
+            if urls is not None:
+                self.cache_identifier_to_cover_url(book_id, urls)
+
+        return urls
+
+    def prefetch_covers(self, log, identifiers, timeout, settings):
+        """Starts downloading best cover of identified book into cache, so that download_cover finds it there."""
+        urls = self.get_cached_cover_url(identifiers, log)
+        if urls:
+            from .cover_fetcher import prefetch_covers
+            log.info('INFO: Prefetching cover in background')
+            prefetch_covers(self, log, urls[:settings.max_covers], timeout, settings)
 
     def download_cover(self, log, result_queue, abort, title=None, authors=None, identifiers=None, timeout=30, get_best_cover=False):
-        if not self.PREFS['covers']:
+        settings = self.settings_snapshot()
+        if not settings.covers:
             return
 
+        # identify run for missing cover urls and cover downloads share single time budget
+        deadline = Deadline(timeout)
         if identifiers is None:
             identifiers = {}
 
-        urls = self.get_cached_cover_url(identifiers)
-        if not urls and not self.cached_identifier_to_cover_url('nocover'):
+        urls = self.get_cached_cover_url(identifiers, log)
+        if urls is None:
             log.info('INFO: No cached cover, need to run identify')
-            rq = Queue()
-            self.identify(log, rq, abort, title, authors, identifiers, timeout)
-            urls = self.get_cached_cover_url(identifiers)
-        elif not urls:
-            log.warn('WARN: No cover available')
-            return
+            results = self.identify_job(log, (title, authors, identifiers), abort, timeout, settings, deadline)
+            if abort.is_set():
+                return
+            for mi in results:
+                urls = self.get_cached_cover_url(mi.identifiers, log)
+                if urls is not None:
+                    break
         else:
             log.info('INFO: Found covers in cache')
-        urls = urls[:self.PREFS['max_covers']]
-        if self.PREFS['threads']:
-            self.download_multiple_covers(title, authors, urls, get_best_cover, timeout, result_queue, abort, log, None)
-        else:
-            for cover in urls:
-                self.download_image(cover, timeout, log, result_queue)
+
+        if not urls:
+            log.warn('WARN: No cover available')
+            return
+
+        from .cover_fetcher import CoverFetcher
+        urls = urls[:settings.max_covers]
+        CoverFetcher(self, log, timeout, settings, deadline).run(urls, result_queue, abort, get_best_cover)
 
     # plugin configuraton window
     def is_customizable(self):
         return True
 
     def config_widget(self):
-        return ConfigWidget()
+        from .config_widget import ConfigWidget
+        return ConfigWidget(self)
 
     def save_settings(self, config_widget):
-        return config_widget.save_settings()
+        prefs = config_widget.save_settings()
+        self.clear_memory_caches()
+        return prefs
 
     def is_configured(self):
         return True
@@ -1,6 +1,11 @@
 # custom options
 IDENTIFIER = "biblionetka"
 BOOK_PAGE_URL_SCHEME = "http://www.biblionetka.pl/book.aspx?id={}"
+COVER_URLS_CACHE_SIZE = 1000  # number of books
+BOOKS_CACHE_SIZE = 200  # number of parsed book pages kept in memory, e.g. for download_cover following identify
+BOOKS_CACHE_TTL = 600  # seconds
+GOOD_COVER_MIN_SIZE = (400, 600)  # width, height in pixels, good enough cover stops other downloads
+COVER_PROBE_SIZE = 32 * 1024  # bytes of image requested to read its dimensions
 
 # plugin options
 name = "biblioNETka.pl"
@@ -29,9 +34,24 @@ setting_defaults = {
     "only_first_author": False,
     "covers": True,
     "max_covers": 5,
+    "cover_probe": True,  # compare covers by dimensions read from image headers before downloading them
+    "max_cover_downloads": 2,  # best covers downloaded after probing
+    "cover_prefetch": False,  # download best cover in background during identify, requires cache
     "threads": True,
     "max_threads": 3,
     "thread_delay": 0.1,
+    "async_backend": False,
+    "rate_limit": 2.0,  # requests per second to a host, 0 disables limit
+    "rate_burst": 4,
+    "max_retries": 3,
+    "retry_backoff": 1.0,  # seconds, doubled with each retry
+    "cache": True,
+    "cache_ttl": 168,  # hours
+    "cache_max_size": 50,  # megabytes
+    "search_cache_ttl": 168,  # hours, searches with results
+    "search_cache_miss_ttl": 24,  # hours, searches without results
+    "metrics": False,
+    "metrics_file": "",  # JSON lines file with metrics summaries, empty disables it
     # metadata settings, optional, delete/comment out to disable
     "title": True,
     "authors": True,
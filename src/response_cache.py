@@ -0,0 +1,167 @@
+import time
+from collections import namedtuple
+
+from .cache_database import DATABASE, call_cache
+
+CacheEntry = namedtuple('CacheEntry', ('body', 'etag', 'last_modified', 'fetched', 'complete'))
+
+
+class ResponseCache:
+    """
+    Persistent cache of HTTP responses, keyed by URL and stored in SQLite database. Access times used for
+    eviction are kept in memory and written along with next write, so that reads do not lock the database.
+    """
+
+    ACCESS_BATCH_SIZE = 50  # access times written at once when no other write happens
+
+    def __init__(self, database, ttl=0, max_size=0):
+        self.database = database
+        self.lock = database.lock
+        self.ttl = ttl
+        self.max_size = max_size
+        self.accessed = {}
+
+    def configure(self, ttl, max_size):
+        """Sets time to live (in seconds) and maximum size (in bytes) of cached responses."""
+
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def connection(self):
+        return self.database.connection()
+
+    def get(self, url):
+        """Returns cached entry for url or None, marking it as recently used."""
+
+        with self.lock:
+            conn = self.connection()
+            row = conn.execute('SELECT body, etag, last_modified, fetched, complete FROM responses WHERE url = ?',
+                               (url,)).fetchone()
+            if row is None:
+                return None
+            self.accessed[url] = time.time()
+            if len(self.accessed) >= self.ACCESS_BATCH_SIZE:
+                self.write_accessed(conn)
+                conn.commit()
+
+        return CacheEntry(row[0], row[1], row[2], row[3], bool(row[4]))
+
+    def is_fresh(self, entry):
+        """Checks if entry may be used without contacting the server."""
+
+        return time.time() - entry.fetched < self.ttl
+
+    def put(self, url, body, etag=None, last_modified=None, complete=True):
+        """
+        Stores response body along with validators, evicting least recently used entries if needed.
+        Bodies not read till the end are marked as incomplete.
+        """
+
+        if self.max_size and len(body) > self.max_size:
+            return
+
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            conn.execute('INSERT OR REPLACE INTO responses '
+                         '(url, body, etag, last_modified, fetched, accessed, size, complete) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (url, body, etag, last_modified, now, now, len(body), complete))
+            self.accessed.pop(url, None)
+            self.write_accessed(conn)
+            self.evict(conn)
+            conn.commit()
+
+    def refresh(self, url):
+        """Marks entry as fetched now, e.g. after server confirmed it has not been modified."""
+
+        now = time.time()
+        with self.lock:
+            conn = self.connection()
+            conn.execute('UPDATE responses SET fetched = ?, accessed = ? WHERE url = ?', (now, now, url))
+            self.accessed.pop(url, None)
+            self.write_accessed(conn)
+            conn.commit()
+
+    def write_accessed(self, conn):
+        """Writes access times collected by get, call with lock held."""
+
+        if self.accessed:
+            conn.executemany('UPDATE responses SET accessed = ? WHERE url = ?',
+                             [(accessed, url) for url, accessed in self.accessed.items()])
+            self.accessed.clear()
+
+    def evict(self, conn):
+        """Removes least recently used entries until cache fits within max_size."""
+
+        if not self.max_size:
+            return
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        while total > self.max_size:
+            url, size = conn.execute('SELECT url, size FROM responses ORDER BY accessed LIMIT 1').fetchone()
+            conn.execute('DELETE FROM responses WHERE url = ?', (url,))
+            total -= size
+
+    def clear(self):
+        """Removes all cached responses."""
+
+        with self.lock:
+            conn = self.connection()
+            conn.execute('DELETE FROM responses')
+            conn.commit()
+            conn.execute('VACUUM')
+            self.accessed.clear()
+
+
+class CachingReader:
+    """Reads HTTP response recording its body, which is stored in cache once reader is closed."""
+
+    def __init__(self, resp, cache, url, log):
+        self.resp = resp
+        self.cache = cache
+        self.url = url
+        self.log = log
+        self.chunks = []
+        self.complete = False
+        self.failed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, amt=None):
+        try:
+            data = self.resp.read(amt)
+        except Exception:
+            self.failed = True
+            raise
+
+        if amt is None or not data:
+            self.complete = True
+        self.chunks.append(data)
+        return data
+
+    def close(self):
+        self.resp.close()
+        if self.failed or self.cache is None:
+            return
+
+        headers = self.resp.headers
+        call_cache(self.log, self.cache.put, self.url, b''.join(self.chunks), headers.get('ETag'),
+                   headers.get('Last-Modified'), self.complete)
+        self.cache = None
+
+
+_CACHE = ResponseCache(DATABASE)
+
+
+def get_response_cache(settings=None):
+    """Returns the response cache, applying cache_ttl and cache_max_size from settings if given."""
+
+    if settings is not None:
+        _CACHE.configure(settings.cache_ttl * 3600, settings.cache_max_size * 1024 * 1024)
+
+    return _CACHE
@@ -0,0 +1,64 @@
+import json
+import time
+
+from .cache_database import DATABASE
+
+
+class SearchCache:
+    """Persistent memo of search results keyed by normalised title and author tokens, misses expire separately."""
+
+    def __init__(self, database, hit_ttl=0, miss_ttl=0):
+        self.database = database
+        self.lock = database.lock
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+
+    def configure(self, hit_ttl, miss_ttl):
+        """Sets time to live (in seconds) of searches with and without results."""
+
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+
+    def connection(self):
+        return self.database.connection()
+
+    def get(self, key):
+        """Returns list of book page urls (or [url, title, authors] lists) or None if search is not cached or expired."""
+
+        with self.lock:
+            row = self.connection().execute('SELECT urls, fetched FROM searches WHERE key = ?', (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        urls = json.loads(row[0])
+        ttl = self.hit_ttl if urls else self.miss_ttl
+        if time.time() - row[1] >= ttl:
+            return None
+
+        return urls
+
+    def put(self, key, urls):
+        with self.lock:
+            conn = self.connection()
+            conn.execute('INSERT OR REPLACE INTO searches (key, urls, fetched) VALUES (?, ?, ?)',
+                         (key, json.dumps(urls), time.time()))
+            conn.commit()
+
+    def clear(self):
+        with self.lock:
+            conn = self.connection()
+            conn.execute('DELETE FROM searches')
+            conn.commit()
+
+
+_CACHE = SearchCache(DATABASE)
+
+
+def get_search_cache(settings=None):
+    """Returns the search memo, applying hit and miss TTLs from settings if given."""
+
+    if settings is not None:
+        _CACHE.configure(settings.search_cache_ttl * 3600, settings.search_cache_miss_ttl * 3600)
+
+    return _CACHE
@@ -0,0 +1,89 @@
+import threading
+from types import MappingProxyType
+
+from .plugin_meta import setting_defaults
+
+
+class Settings:
+    """
+    Immutable snapshot of plugin settings with values validated against types of setting_defaults,
+    read as attributes. Values of wrong type (or negative numbers) are replaced with defaults.
+    """
+
+    values: MappingProxyType  # set in __init__ bypassing read-only __setattr__
+
+    def __init__(self, prefs, defaults=setting_defaults):
+        values = {}
+        for name, default in defaults.items():
+            try:
+                value = prefs[name]
+            except KeyError:
+                value = default
+            values[name] = self.validate(value, default)
+
+        object.__setattr__(self, 'values', MappingProxyType(values))
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    @staticmethod
+    def validate(value, default):
+        kind = type(default)
+        if kind is bool:
+            return value if isinstance(value, bool) else default
+        if isinstance(value, bool):
+            return default
+
+        try:
+            value = kind(value)
+        except (TypeError, ValueError):
+            return default
+
+        if kind in (int, float) and value < 0:
+            return default
+
+        return value
+
+    def get(self, name, default=None):
+        """Returns setting value, default for settings missing in setting_defaults (e.g. disabled fields)."""
+
+        return self.values.get(name, default)
+
+    def __contains__(self, name):
+        return name in self.values
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Settings snapshot is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('Settings snapshot is read-only')
+
+    def __repr__(self):
+        return 'Settings({})'.format(dict(self.values))
+
+
+_SNAPSHOT = None  # (prefs, Settings) pair
+_SNAPSHOT_LOCK = threading.Lock()
+
+
+def get_settings(prefs):
+    """
+    Returns settings snapshot of prefs, shared until prefs object changes or settings are saved.
+    prefs are re-read from disk before taking new snapshot, as settings dialog writes them using its own instance.
+    """
+
+    global _SNAPSHOT
+    with _SNAPSHOT_LOCK:
+        if _SNAPSHOT is None or _SNAPSHOT[0] is not prefs:
+            if hasattr(prefs, 'refresh'):
+                prefs.refresh()
+            _SNAPSHOT = (prefs, Settings(prefs))
+
+        return _SNAPSHOT[1]
+
+
+def invalidate_settings():
+    """Drops current snapshot, next identify or cover download takes new one."""
+
+    global _SNAPSHOT
+    with _SNAPSHOT_LOCK:
+        _SNAPSHOT = None
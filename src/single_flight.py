@@ -0,0 +1,62 @@
+import threading
+from concurrent.futures import Future, TimeoutError
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key, callers arriving during the first one wait for its result."""
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function, *args, deadline=None, abort=None):
+        """
+        Returns result of function(*args) along with information whether it was shared with other caller.
+        Waiting caller raises TimeoutError when its deadline expires or abort is set before result is ready.
+        """
+
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+
+        if not leader:
+            return self.wait(call, deadline, abort), True
+
+        try:
+            result = function(*args)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def __contains__(self, key):
+        """Checks if call with given key is in progress."""
+
+        with self.lock:
+            return key in self.calls
+
+    def wait(self, call, deadline=None, abort=None):
+        """Returns result of call, polling abort and deadline of waiting caller."""
+
+        while True:
+            if abort is not None and abort.is_set():
+                raise TimeoutError('Aborted while waiting for shared call')
+            timeout = self.POLL_INTERVAL if abort is not None else None
+            remaining = deadline.remaining() if deadline is not None else None
+            if remaining is not None:
+                if remaining <= 0:
+                    raise TimeoutError('Time budget exhausted while waiting for shared call')
+                timeout = min(timeout, remaining) if timeout is not None else remaining
+            try:
+                return call.result(timeout=timeout)
+            except TimeoutError:
+                continue
@@ -0,0 +1,85 @@
+import socket
+import threading
+import time
+
+
+class RateLimitTimeout(socket.timeout):
+    """Raised when waiting for rate limiter would not fit in time budget, retrying the request would not help."""
+
+
+class Throttle:
+    """Spaces consecutive requests at least delay seconds apart, shared between threads."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.last_request = 0.0
+
+    def wait(self, deadline=None):
+        """Waits for the next request slot, but not past deadline if given. Returns False if deadline is exceeded."""
+
+        if self.delay <= 0:
+            return True
+
+        with self.lock:
+            wait_time = self.last_request + self.delay - time.monotonic()
+            if deadline is not None and not deadline.allows(wait_time):
+                return False
+            if wait_time > 0:
+                time.sleep(wait_time)
+            self.last_request = time.monotonic()
+            return True
+
+
+class TokenBucket:
+    """Token bucket rate limiter shared between threads, can be paused e.g. when server asks to slow down."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def configure(self, rate, burst):
+        """Sets rate (tokens per second, 0 disables limiting) and maximum number of tokens."""
+
+        with self.lock:
+            self.rate = rate
+            self.burst = max(burst, 1)
+            self.tokens = min(self.tokens, self.burst)
+
+    def reserve(self, deadline=None):
+        """
+        Takes token and returns number of seconds caller has to wait before using it. Raises RateLimitTimeout,
+        without taking token, if the wait would not fit in deadline.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            pause = max(self.paused_until - now, 0)
+            wait_time = pause
+            if self.rate > 0:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens < 1:
+                    wait_time = max((1 - self.tokens) / self.rate, pause)
+
+            if wait_time > 0 and deadline is not None and not deadline.allows(wait_time):
+                raise RateLimitTimeout('rate limit wait of {:.1f}s exceeds time budget'.format(wait_time))
+
+            if self.rate > 0:
+                self.tokens -= 1
+            return wait_time
+
+    def acquire(self, deadline=None):
+        delay = self.reserve(deadline)
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """Holds back all requests for given number of seconds."""
+
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
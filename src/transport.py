@@ -0,0 +1,423 @@
+import email.utils
+import functools
+import http.client
+import http.cookiejar
+import random
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DECODE_ERRORS = (zlib.error, brotli.error) if brotli is not None else (zlib.error,)
+
+from .throttle import TokenBucket, RateLimitTimeout
+from .metrics import NULL_METRICS
+
+
+class ZlibDecoder:
+    """
+    Streaming gzip or zlib decoder (detected by header). Falls back to raw deflate stream, which some servers
+    (e.g. IIS) send as deflate encoding.
+    """
+
+    def __init__(self):
+        self.decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+        self.started = False
+
+    def decompress(self, data):
+        if self.started or not data:
+            return self.decompressor.decompress(data)
+
+        self.started = True
+        try:
+            return self.decompressor.decompress(data)
+        except zlib.error:
+            self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self.decompressor.decompress(data)
+
+    def flush(self):
+        return self.decompressor.flush()
+
+
+class BrotliDecoder:
+    """Streaming brotli decoder with the same interface as zlib decompress objects."""
+
+    def __init__(self):
+        self.decompressor = brotli.Decompressor()
+
+    def decompress(self, data):
+        return self.decompressor.process(data)
+
+    def flush(self):
+        return b''
+
+
+def get_decoder(content_encoding):
+    """Returns streaming decoder for given Content-Encoding or None for identity encoding."""
+
+    content_encoding = (content_encoding or '').strip().lower()
+    if content_encoding in ('gzip', 'x-gzip', 'deflate'):
+        return ZlibDecoder()
+    if content_encoding == 'br' and brotli is not None:
+        return BrotliDecoder()
+
+    return None
+
+
+def decode(decoder, data):
+    """Decodes whole body, raising URLError for malformed one."""
+
+    try:
+        return decoder.decompress(data) + decoder.flush()
+    except DECODE_ERRORS as e:
+        raise urllib.error.URLError('Could not decode response: {}'.format(e))
+
+
+class Response:
+    """HTTP response, its connection returns to the pool once body is fully read and response is closed."""
+
+    MAX_DRAIN_SIZE = 64 * 1024  # bytes of unread body read on close to keep connection alive
+
+    def __init__(self, transport, key, conn, resp, url, metrics=NULL_METRICS):
+        self.transport = transport
+        self.metrics = metrics
+        self.key = key
+        self.conn = conn
+        self.resp = resp
+        self.url = url
+        self.status = resp.status
+        self.headers = resp.headers
+        self.decoder = get_decoder(resp.headers.get('Content-Encoding'))
+        self.decoded = b''  # decoded data exceeding amount requested by last read
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def read(self, amt=None):
+        """
+        Reads and decodes body, returning at most amt bytes, empty bytes are returned only at its end.
+        Malformed compressed body raises URLError.
+        """
+
+        with self.metrics.phase('body'):
+            try:
+                data = self.read_decoded(amt)
+            except DECODE_ERRORS as e:
+                raise urllib.error.URLError('Could not decode response: {}'.format(e))
+        self.metrics.count('bytes', len(data))
+        return data
+
+    def read_raw(self, amt):
+        raw = self.resp.read(amt)
+        self.metrics.count('bytes_wire', len(raw))
+        return raw
+
+    def read_decoded(self, amt):
+        if self.decoder is None:
+            return self.read_raw(amt)
+
+        if amt is None:
+            data = self.decoded + self.decoder.decompress(self.read_raw(None)) + self.decoder.flush()
+            self.decoded = b''
+            return data
+
+        while not self.decoded:
+            raw = self.read_raw(amt)
+            if not raw:
+                self.decoded = self.decoder.flush()
+                break
+            self.decoded = self.decoder.decompress(raw)
+
+        data, self.decoded = self.decoded[:amt], self.decoded[amt:]
+        return data
+
+    def drain(self):
+        """Reads rest of short body (e.g. of 304, 404 or 503 responses), so that connection can be reused."""
+
+        if self.resp.will_close or (self.resp.length or 0) > self.MAX_DRAIN_SIZE:
+            return
+
+        drained = 0
+        try:
+            while not self.resp.isclosed() and drained <= self.MAX_DRAIN_SIZE:
+                data = self.resp.read(self.MAX_DRAIN_SIZE + 1 - drained)
+                if not data:
+                    break
+                drained += len(data)
+        except (OSError, http.client.HTTPException):
+            pass
+
+    def close(self):
+        if self.conn is None:
+            return
+
+        self.drain()
+        if self.resp.isclosed() and not self.resp.will_close:
+            self.transport.release(self.key, self.conn)
+        else:
+            self.resp.close()
+            self.conn.close()
+        self.conn = None
+
+
+class HttpTransport:
+    """Thread-safe HTTP client keeping persistent (keep-alive) connections per host."""
+
+    is_async = False
+    MAX_REDIRECTS = 5
+    MAX_IDLE_CONNECTIONS = 4
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+    USER_AGENT = 'Python-urllib/{}.{}'.format(*sys.version_info[:2])
+    ACCEPT_ENCODING = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+    RETRY_CODES = (429, 503)
+    MAX_RETRY_DELAY = 60
+
+    def __init__(self, rate_limit=0, rate_burst=1, max_retries=0, retry_backoff=1.0):
+        self.cookies = http.cookiejar.CookieJar()
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.limiters = {}
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+    def configure(self, rate_limit, rate_burst, max_retries, retry_backoff):
+        """Sets per host rate limit (requests per second, 0 disables it) and retry policy."""
+
+        with self.lock:
+            self.rate_limit = rate_limit
+            self.rate_burst = rate_burst
+            self.max_retries = max_retries
+            self.retry_backoff = retry_backoff
+            for limiter in self.limiters.values():
+                limiter.configure(rate_limit, rate_burst)
+
+    def limiter(self, host):
+        """Returns rate limiter of given host."""
+
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = TokenBucket(self.rate_limit, self.rate_burst)
+            return self.limiters[host]
+
+    def connect(self, key, timeout):
+        """Returns idle connection to host or a new one, along with information whether it was reused."""
+
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                conn = connections.pop()
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(host, port, timeout=timeout), False
+
+    def release(self, key, conn):
+        """Returns connection to the pool of idle connections."""
+
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.MAX_IDLE_CONNECTIONS:
+                connections.append(conn)
+                return
+
+        conn.close()
+
+    def close(self):
+        """Closes all idle connections."""
+
+        with self.lock:
+            connections = [conn for host_connections in self.idle.values() for conn in host_connections]
+            self.idle.clear()
+
+        for conn in connections:
+            conn.close()
+
+    def request(self, url, headers=None, timeout=None, method='GET', metrics=NULL_METRICS, deadline=None):
+        """
+        Sends request following redirects and returns Response. Network errors are raised as URLError.
+        Failed requests, including HTTP 429 and 503, are retried with jittered exponential backoff
+        or after delay requested by server in Retry-After header, unless it would exceed deadline.
+        """
+
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            if attempt:
+                metrics.count('retries')
+            if deadline and deadline.expired():
+                raise socket.timeout('time budget exhausted')
+            request_timeout = deadline.timeout(timeout) if deadline else timeout
+            try:
+                response = self.request_once(url, headers, request_timeout, method, metrics, deadline)
+            except RateLimitTimeout:
+                raise
+            except (urllib.error.URLError, socket.timeout):
+                delay = self.backoff(attempt)
+                if last_attempt or (deadline and not deadline.allows(delay)):
+                    raise
+            else:
+                if response.status not in self.RETRY_CODES or last_attempt:
+                    return response
+                delay = max(self.get_retry_after(response), self.backoff(attempt))
+                if deadline and not deadline.allows(delay):
+                    return response
+                response.close()
+                self.pause_host(response, delay)
+
+            time.sleep(delay)
+
+    def pause_host(self, response, delay):
+        """Holds back other requests to the host which rejected the request."""
+
+        self.limiter(urllib.parse.urlsplit(response.url).hostname).pause(delay)
+
+    def backoff(self, attempt):
+        """Returns jittered, exponentially growing delay before next attempt."""
+
+        delay = self.retry_backoff * 2 ** attempt
+        return min(random.uniform(delay / 2, delay * 3 / 2), self.MAX_RETRY_DELAY)
+
+    def get_retry_after(self, response):
+        """Returns delay in seconds requested by server in Retry-After header, 0 if there is none."""
+
+        value = response.headers.get('Retry-After')
+        if not value:
+            return 0
+
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return 0
+
+        return min(max(delay, 0), self.MAX_RETRY_DELAY)
+
+    def request_once(self, url, headers, timeout, method, metrics=NULL_METRICS, deadline=None):
+        for _ in range(self.MAX_REDIRECTS + 1):
+            response = self.send(method, url, headers or {}, timeout, metrics, deadline)
+            location = response.headers.get('Location')
+            if response.status not in self.REDIRECT_CODES or not location:
+                return response
+
+            response.read()
+            response.close()
+            url = urllib.parse.urljoin(url, location)
+            if response.status == 303:
+                method = 'GET'
+
+        raise urllib.error.URLError('Too many redirects: {}'.format(url))
+
+    def prepare_request(self, method, url, headers):
+        """Returns connection key, path, urllib Request (needed for cookies) and headers to send."""
+
+        parts = urllib.parse.urlsplit(url)
+        default_port = 443 if parts.scheme == 'https' else 80
+        key = (parts.scheme, parts.hostname, parts.port or default_port)
+        path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        req = urllib.request.Request(url, headers=headers, method=method)
+        req.add_header('User-agent', self.USER_AGENT)
+        if not req.has_header('Accept-encoding'):
+            req.add_header('Accept-encoding', self.ACCEPT_ENCODING)
+        self.cookies.add_cookie_header(req)
+        return key, path, req, dict(req.header_items())
+
+    def send(self, method, url, headers, timeout, metrics=NULL_METRICS, deadline=None):
+        key, path, req, request_headers = self.prepare_request(method, url, headers)
+
+        with metrics.phase('rate_limit'):
+            self.limiter(key[1]).acquire(deadline)
+        metrics.count('requests')
+        while True:
+            conn, reused = self.connect(key, timeout)
+            try:
+                if not reused:
+                    if metrics.enabled:
+                        conn._create_connection = functools.partial(self.create_connection, metrics)
+                    with metrics.phase('connect'):
+                        conn.connect()
+                with metrics.phase('first_byte'):
+                    conn.request(method, path, headers=request_headers)
+                    resp = conn.getresponse()
+                break
+            except (http.client.HTTPException, ConnectionError) as e:
+                conn.close()
+                if not reused:
+                    raise urllib.error.URLError(e)
+                # persistent connection was closed by server in the meantime, retry with fresh one
+            except socket.timeout:
+                conn.close()
+                raise
+            except OSError as e:
+                conn.close()
+                raise urllib.error.URLError(e)
+
+        self.cookies.extract_cookies(resp, req)
+        return Response(self, key, conn, resp, url, metrics)
+
+    def create_connection(self, metrics, address, timeout=None, source_address=None):
+        """Same as socket.create_connection, but records time of name resolution separately."""
+
+        host, port = address
+        with metrics.phase('dns'):
+            addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+        error = OSError('getaddrinfo returns an empty list')
+        for family, socktype, proto, _, sockaddr in addresses:
+            sock = socket.socket(family, socktype, proto)
+            try:
+                sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except OSError as e:
+                sock.close()
+                error = e
+
+        raise error
+
+
+_TRANSPORT = HttpTransport()
+
+
+def get_transport(settings=None):
+    """
+    Returns the process-wide transport, asyncio based one if enabled in settings,
+    with rate limit and retry policy taken from settings if given.
+    """
+
+    if settings is None:
+        return _TRANSPORT
+
+    transport = _TRANSPORT
+    if settings.async_backend:
+        from .async_transport import get_async_transport
+        transport = get_async_transport()
+
+    transport.configure(settings.rate_limit, settings.rate_burst, settings.max_retries, settings.retry_backoff)
+    return transport
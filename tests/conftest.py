@@ -0,0 +1,222 @@
+import http.server
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+import time
+import types
+from queue import Queue
+from threading import Event
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+PACKAGE = 'calibre_plugins.biblionetka'
+
+
+def register_package():
+    """
+    Makes plugin modules importable as calibre_plugins.biblionetka submodules, the way calibre loads them,
+    without running package __init__, so that modules not depending on calibre can be tested outside of it.
+    """
+
+    if 'calibre_plugins' not in sys.modules:
+        namespace = types.ModuleType('calibre_plugins')
+        namespace.__path__ = []
+        sys.modules['calibre_plugins'] = namespace
+
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [SRC]
+        sys.modules[PACKAGE] = package
+
+
+register_package()
+
+
+class Log:
+    """Records messages of calibre's log interface."""
+
+    def __init__(self):
+        self.messages = []
+
+    def record(self, level, message):
+        self.messages.append((level, message))
+
+    def debug(self, message, *args):
+        self.record('debug', message)
+
+    def info(self, message, *args):
+        self.record('info', message)
+
+    def warn(self, message, *args):
+        self.record('warn', message)
+
+    def error(self, message, *args):
+        self.record('error', message)
+
+    def exception(self, message, *args):
+        self.record('exception', message)
+
+    def levels(self, *levels):
+        return [message for level, message in self.messages if level in levels]
+
+
+@pytest.fixture
+def log():
+    return Log()
+
+
+class Clock:
+    """Fake time.time and time.monotonic, advanced only by fake time.sleep."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += max(seconds, 0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    monkeypatch.setattr(time, 'monotonic', clock)
+    monkeypatch.setattr(time, 'sleep', clock.sleep)
+    return clock
+
+
+class ScriptedHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers with responses queued in server.responses, then with server.pages by path or 200 if path is unknown.
+    Records request paths, responses are sent after server.delay seconds.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.server.responses:
+            status, headers, body = self.server.responses.pop(0)
+        else:
+            status, headers, body = self.server.pages.get(self.path, (200, {}, b'ok'))
+        time.sleep(self.server.delay)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.responses = []
+    server.pages = {}
+    server.requests = []
+    server.delay = 0
+    server.url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def load_benchmark():
+    """Imports benchmarks/benchmark.py, whose fixtures, replay server and fixture parser tests reuse."""
+
+    if 'benchmark' not in sys.modules:
+        spec = importlib.util.spec_from_file_location('benchmark', os.path.join(ROOT, 'benchmarks', 'benchmark.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['benchmark'] = module
+        spec.loader.exec_module(module)
+
+    return sys.modules['benchmark']
+
+
+class Replay:
+    """Plugin talking to local server which replays pages from benchmarks/fixtures and records requests."""
+
+    def __init__(self, benchmark, fixtures, server):
+        self.benchmark = benchmark
+        self.fixtures = fixtures
+        self.server = server
+        self.requests = server.requests
+
+    def make_plugin(self, **overrides):
+        """Returns plugin with default settings changed by overrides, cache and rate limit are off by default."""
+
+        plugin_meta = importlib.import_module(PACKAGE + '.plugin_meta')
+        plugin_base = importlib.import_module(PACKAGE + '.plugin_base')
+        overrides.setdefault('cache', False)
+        overrides.setdefault('rate_limit', 0)
+        plugin = plugin_base.BaseSource(None)
+        plugin.PREFS = self.benchmark.make_prefs(plugin_meta, **overrides)
+        plugin.COVER_URLS.clear()
+        plugin.BOOKS.clear()
+        return plugin
+
+    def identify(self, plugin, title, authors, identifiers=None, abort=None, timeout=30, log=None):
+        queue = Queue()
+        plugin.identify(log or Log(), queue, abort or Event(), title, authors, identifiers or {}, timeout)
+        return [queue.get() for _ in range(queue.qsize())]
+
+    def download_cover(self, plugin, title, authors, identifiers=None, abort=None, timeout=30, log=None):
+        queue = Queue()
+        plugin.download_cover(log or Log(), queue, abort or Event(), title, authors, identifiers or {}, timeout)
+        return [queue.get()[1] for _ in range(queue.qsize())]
+
+
+@pytest.fixture
+def replay(monkeypatch, tmp_path):
+    """
+    Replay of committed fixtures parsed with benchmarks/fixture_parser.py. Shared transports are replaced
+    for the test and cache database is kept in tmp_path. Needs lxml and calibre.
+    """
+
+    pytest.importorskip('lxml')
+    pytest.importorskip('calibre')
+    benchmark = load_benchmark()
+    fixtures = benchmark.Fixtures(benchmark.FIXTURES)
+    if PACKAGE + '.page_parser' not in sys.modules:
+        benchmark.install_fixture_parser(fixtures.index['parser'])
+
+    class RecordingReplayHandler(benchmark.ReplayHandler):
+        def do_GET(self):
+            self.server.requests.append(fixtures.by_key.get(self.path.lstrip('/'), self.path))
+            super().do_GET()
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RecordingReplayHandler)
+    server.daemon_threads = True
+    server.fixtures = fixtures
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    transport = importlib.import_module(PACKAGE + '.transport')
+    async_transport = importlib.import_module(PACKAGE + '.async_transport')
+    cache_database = importlib.import_module(PACKAGE + '.cache_database')
+    # original values are restored once test ends
+    monkeypatch.setattr(transport, '_TRANSPORT', None)
+    monkeypatch.setattr(async_transport, '_ASYNC_TRANSPORT', None)
+    benchmark.install_replay_transports('http://127.0.0.1:{}'.format(server.server_address[1]))
+    monkeypatch.setattr(cache_database.DATABASE, 'path', str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setattr(cache_database.DATABASE, 'conn', None)
+
+    yield Replay(benchmark, fixtures, server)
+
+    server.shutdown()
+    server.server_close()
+    if cache_database.DATABASE.conn is not None:
+        cache_database.DATABASE.conn.close()
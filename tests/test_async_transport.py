@@ -0,0 +1,51 @@
+import asyncio
+import urllib.error
+import zlib
+
+import pytest
+
+from calibre_plugins.biblionetka.async_transport import AsyncHttpTransport
+from calibre_plugins.biblionetka.transport import get_decoder, decode
+
+
+def read_chunked(data):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await AsyncHttpTransport().read_chunked(reader)
+
+    return asyncio.run(read())
+
+
+def test_read_chunked_joins_chunks():
+    assert read_chunked(b'5\r\nHello\r\n7\r\n, world\r\n0\r\n\r\n') == b'Hello, world'
+
+
+def test_read_chunked_ignores_extensions_and_trailers():
+    body = b'a;name=value\r\n0123456789\r\n0\r\nExpires: never\r\n\r\n'
+
+    assert read_chunked(body) == b'0123456789'
+
+
+def test_read_chunked_fails_on_truncated_body():
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_chunked(b'a\r\n01234')
+
+
+@pytest.mark.parametrize('wbits', [zlib.MAX_WBITS, -zlib.MAX_WBITS, zlib.MAX_WBITS | 16])
+def test_decode_zlib_raw_deflate_and_gzip(wbits):
+    compressor = zlib.compressobj(wbits=wbits)
+    body = compressor.compress(b'page' * 100) + compressor.flush()
+
+    assert decode(get_decoder('deflate'), body) == b'page' * 100
+
+
+def test_decode_malformed_body_raises_url_error():
+    with pytest.raises(urllib.error.URLError):
+        decode(get_decoder('gzip'), b'not compressed at all')
+
+
+def test_identity_encoding_has_no_decoder():
+    assert get_decoder(None) is None
+    assert get_decoder('identity') is None
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from calibre_plugins.biblionetka.book_cache import BookCache
+from calibre_plugins.biblionetka.cache_database import CacheDatabase, call_cache
+from calibre_plugins.biblionetka.deadline import Deadline
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BookCache(CacheDatabase(str(tmp_path / 'cache.sqlite')), ttl=3600)
+
+
+def in_thread(function, *args):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function(*args)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_lease_is_exclusive_until_released(cache):
+    assert cache.claim('url', 30)
+    assert not in_thread(cache.claim, 'url', 30)
+
+    cache.release('url')
+    assert in_thread(cache.claim, 'url', 30)
+
+
+def test_lease_is_released_only_by_owner(cache):
+    assert cache.claim('url', 30)
+    in_thread(cache.release, 'url')
+
+    assert not in_thread(cache.claim, 'url', 30)
+
+
+def test_expired_lease_is_taken_over(cache):
+    assert cache.claim('url', 0)
+
+    assert in_thread(cache.claim, 'url', 30)
+
+
+def test_wait_for_release_returns_once_lease_is_released(cache):
+    assert cache.claim('url', 30)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(cache.wait_for_release('url', Deadline(5))))
+    waiter.start()
+    time.sleep(0.2)
+    cache.release('url')
+    waiter.join()
+
+    assert result == [True]
+
+
+def test_wait_for_release_gives_up_at_deadline(cache):
+    in_thread(cache.claim, 'url', 30)
+
+    assert not cache.wait_for_release('url', Deadline(0.3))
+
+
+def test_clear_keeps_leases_in_progress(cache):
+    cache.claim('url', 30)
+    cache.claim('expired', 0)
+    cache.clear()
+
+    leases = cache.database.connection().execute('SELECT key FROM leases').fetchall()
+    assert leases == [('url',)]
+
+
+def test_corrupted_database_lets_fetch_go_on(tmp_path, log):
+    path = tmp_path / 'cache.sqlite'
+    path.write_bytes(b'not a database' * 1000)
+    cache = BookCache(CacheDatabase(str(path)), ttl=3600)
+
+    assert call_cache(log, cache.claim, 'url', 30, default=True) is True
+    assert call_cache(log, cache.get_covers, '1') is None
+    assert call_cache(log, cache.contains, 'url', frozenset(['title']), default=False) is False
+    call_cache(log, cache.release, 'url')
+    assert len(log.levels('error')) == 4
@@ -0,0 +1,76 @@
+import struct
+import time
+import zlib
+
+import pytest
+
+pytest.importorskip('calibre')
+
+from calibre_plugins.biblionetka import cover_fetcher
+from calibre_plugins.biblionetka.cover_fetcher import CoverFetcher
+from calibre_plugins.biblionetka.settings import Settings
+
+
+def make_png(width, height):
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    rows = b''.join(b'\x00' + bytes(width) for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+@pytest.fixture
+def settings():
+    return Settings({'cache': False, 'rate_limit': 0, 'thread_delay': 0, 'max_retries': 0})
+
+
+def png_page(cdata, status=200, total=None):
+    headers = {'Content-Type': 'image/png'}
+    if status == 206:
+        headers['Content-Range'] = 'bytes 0-{}/{}'.format(len(cdata) - 1, total or len(cdata))
+    return status, headers, cdata
+
+
+def test_choose_prefers_largest_cover_from_probes(http_server, settings, log):
+    small, large = make_png(100, 150), make_png(500, 750)
+    http_server.pages = {
+        '/small.png': png_page(small),
+        # server honouring Range sends only beginning of large image
+        '/large.png': png_page(large[:64], 206, total=len(large)),
+        '/missing.png': (404, {}, b''),
+    }
+    urls = [http_server.url + path for path in ('/small.png', '/missing.png', '/large.png')]
+    fetcher = CoverFetcher(None, log, 30, settings)
+
+    assert fetcher.choose(urls, None, 1) == [http_server.url + '/large.png']
+    assert fetcher.choose(urls, None, 2) == [http_server.url + '/large.png', http_server.url + '/small.png']
+    # small image came whole with probe, large one is still to be downloaded
+    assert fetcher.downloaded == {http_server.url + '/small.png': small}
+
+
+def test_complete_range_probe_is_kept(http_server, settings, log):
+    cover = make_png(100, 150)
+    http_server.pages = {'/cover.png': png_page(cover, 206)}
+    fetcher = CoverFetcher(None, log, 30, settings)
+
+    probe = fetcher.probe(http_server.url + '/cover.png')
+
+    assert (probe.width, probe.height, probe.size, probe.cdata) == (100, 150, len(cover), cover)
+
+
+def test_download_waits_for_prefetch_in_flight(http_server, settings, log):
+    cover = make_png(100, 150)
+    http_server.pages = {'/cover.png': png_page(cover)}
+    http_server.delay = 0.3
+    url = http_server.url + '/cover.png'
+
+    prefetch = cover_fetcher.prefetch_covers(None, log, [url], 30, settings)
+    started = time.monotonic()
+    while url not in CoverFetcher.DOWNLOAD_FLIGHTS and time.monotonic() - started < 5:
+        time.sleep(0.01)
+    cdata = CoverFetcher(None, log, 30, settings).download(url)
+    prefetch.result()
+
+    assert cdata == cover
+    assert http_server.requests == ['/cover.png']
@@ -0,0 +1,38 @@
+from calibre_plugins.biblionetka.deadline import Deadline
+
+
+def test_remaining_shrinks_until_expired(clock):
+    deadline = Deadline(10)
+
+    clock.sleep(4)
+    assert deadline.remaining() == 6
+    assert not deadline.expired()
+    clock.sleep(6)
+    assert deadline.remaining() == 0
+    assert deadline.expired()
+
+
+def test_timeout_is_capped_by_remaining_time(clock):
+    deadline = Deadline(10)
+    clock.sleep(8)
+
+    assert deadline.timeout(5) == 2
+    assert deadline.timeout(1) == 1
+    assert deadline.timeout(None) == 2
+
+
+def test_allows(clock):
+    deadline = Deadline(10)
+
+    assert deadline.allows(9)
+    assert not deadline.allows(10)
+
+
+def test_no_budget_never_expires(clock):
+    deadline = Deadline(0)
+
+    clock.sleep(10 ** 6)
+    assert deadline.remaining() is None
+    assert not deadline.expired()
+    assert deadline.timeout(5) == 5
+    assert deadline.allows(10 ** 6)
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from conftest import Log
+
+
+@pytest.mark.parametrize('cache', [False, True])
+def test_title_not_extracted_from_page_is_callers_own(replay, cache):
+    plugin = replay.make_plugin(title=False, authors=False, max_results=1, cache=cache)
+
+    first = replay.identify(plugin, 'Query One', ['First Author'], {'biblionetka': '2'})
+    second = replay.identify(plugin, 'Totally Different', ['Second Author'], {'biblionetka': '2'})
+
+    assert [(mi.title, mi.authors) for mi in first] == [('Query One', ['First Author'])]
+    assert [(mi.title, mi.authors) for mi in second] == [('Totally Different', ['Second Author'])]
+    assert replay.requests.count('http://www.biblionetka.pl/book.aspx?id=2') == 1
+    if cache:
+        plugin.BOOKS.clear()
+        third = replay.identify(plugin, 'Third Query', ['Third Author'], {'biblionetka': '2'})
+        assert [(mi.title, mi.authors) for mi in third] == [('Third Query', ['Third Author'])]
+        assert replay.requests.count('http://www.biblionetka.pl/book.aspx?id=2') == 1
+
+
+def test_extracted_title_comes_from_page(replay):
+    plugin = replay.make_plugin(max_results=1)
+
+    results = replay.identify(plugin, 'Query One', ['First Author'], {'biblionetka': '2'})
+
+    assert [(mi.title, mi.authors) for mi in results] == [('Lalka. Tom 2', ['Bolesław Prus'])]
+
+
+def hold_book_flight(key, mi):
+    """Starts parsing of book page in other thread, which returns mi once released."""
+
+    from calibre_plugins.biblionetka.parser_base import ParserBase
+    started = threading.Event()
+    release = threading.Event()
+
+    def parse():
+        started.set()
+        release.wait(5)
+        return mi
+
+    thread = threading.Thread(target=ParserBase.BOOK_FLIGHTS.do, args=(key, parse))
+    thread.start()
+    started.wait(5)
+    threading.Timer(0.3, release.set).start()
+    return thread
+
+
+def get_field_plan(plugin):
+    return plugin.create_parser(Log(), 30, plugin.settings_snapshot()).field_plan.fields
+
+
+def test_book_parsed_by_other_thread_with_same_fields_is_shared(replay):
+    from calibre.ebooks.metadata.book.base import Metadata
+    plugin = replay.make_plugin(title=False, max_results=1)
+    url = 'http://www.biblionetka.pl/book.aspx?id=2'
+    leader = hold_book_flight((url, get_field_plan(plugin)), Metadata('Unknown', ['Shared Author']))
+
+    results = replay.identify(plugin, 'Own Title', ['Own Author'], {'biblionetka': '2'})
+    leader.join()
+
+    assert [(mi.title, mi.authors) for mi in results] == [('Own Title', ['Shared Author'])]
+    assert url not in replay.requests
+
+
+def test_book_parsed_by_other_thread_with_other_fields_is_not_shared(replay):
+    from calibre.ebooks.metadata.book.base import Metadata
+    plugin = replay.make_plugin(max_results=1)
+    url = 'http://www.biblionetka.pl/book.aspx?id=2'
+    leader = hold_book_flight((url, frozenset(['title'])), Metadata('Other Plan', ['Other Author']))
+
+    results = replay.identify(plugin, 'Own Title', ['Own Author'], {'biblionetka': '2'})
+    leader.join()
+
+    assert [(mi.title, mi.authors) for mi in results] == [('Lalka. Tom 2', ['Bolesław Prus'])]
+    assert url in replay.requests
+
+
+def test_identify_served_from_cache_is_not_throttled(replay):
+    plugin = replay.make_plugin(cache=True, max_results=3, threads=True, max_threads=3, thread_delay=0.3)
+    first = replay.identify(plugin, 'Lalka', ['Bolesław Prus'])
+    requests = len(replay.requests)
+
+    start = time.monotonic()
+    second = replay.identify(plugin, 'Lalka', ['Bolesław Prus'])
+
+    assert time.monotonic() - start < 0.3
+    assert len(replay.requests) == requests
+    assert [mi.title for mi in second] == [mi.title for mi in first]
+
+
+SEARCH_URL = 'http://www.biblionetka.pl/search.aspx?searchType=book&searchPhrase=Lalka'
+
+
+def test_known_identifier_skips_search(replay):
+    plugin = replay.make_plugin(max_results=1)
+
+    results = replay.identify(plugin, 'Lalka', ['Bolesław Prus'], {'biblionetka': '1'})
+
+    assert [mi.title for mi in results] == ['Lalka']
+    assert replay.requests == ['http://www.biblionetka.pl/book.aspx?id=1']
+
+
+def test_unknown_identifier_falls_back_to_search(replay):
+    plugin = replay.make_plugin(max_results=1, authors_search=False)
+    log = Log()
+
+    results = replay.identify(plugin, 'Lalka', ['Bolesław Prus'], {'biblionetka': '999'}, log=log)
+
+    assert len(results) == 1
+    assert SEARCH_URL in replay.requests
+    assert any('falling back to search' in message for message in log.levels('warn'))
+
+
+def test_aborted_identify_makes_no_requests(replay):
+    plugin = replay.make_plugin(max_results=3)
+    abort = threading.Event()
+    abort.set()
+
+    results = replay.identify(plugin, 'Lalka', ['Bolesław Prus'], {'biblionetka': '1'}, abort=abort)
+
+    assert results == []
+    assert replay.requests == []
+
+
+def test_expired_deadline_skips_requests(replay):
+    plugin = replay.make_plugin(max_results=3)
+
+    results = replay.identify(plugin, 'Lalka', ['Bolesław Prus'], timeout=1e-6)
+
+    assert results == []
+    assert replay.requests == []
@@ -0,0 +1,46 @@
+from calibre_plugins.biblionetka.lru_cache import LRUCache
+
+
+def test_least_recently_used_is_evicted():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_put_replaces_value():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('a', 2)
+
+    assert cache.get('a') == 2
+    assert len(cache) == 1
+
+
+def test_missing_key_returns_default():
+    assert LRUCache(2).get('a', 'default') == 'default'
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = LRUCache(2, ttl=10)
+    cache.put('a', 1)
+
+    clock.sleep(9)
+    assert cache.get('a') == 1
+    clock.sleep(1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_clear():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.clear()
+
+    assert 'a' not in cache
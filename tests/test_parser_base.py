@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip('lxml')
+pytest.importorskip('calibre')
+
+from calibre_plugins.biblionetka.metrics import NULL_METRICS
+from calibre_plugins.biblionetka.parser_base import ParserBase, SearchResult
+
+
+class Log:
+    def debug(self, *args):
+        pass
+
+
+@pytest.fixture
+def parser():
+    # ranking needs neither plugin nor network, so parser is not fully initialised
+    parser = ParserBase.__new__(ParserBase)
+    parser.log = Log()
+    parser.metrics = NULL_METRICS
+    return parser
+
+
+def test_results_are_ordered_by_match_with_searched_book(parser):
+    results = [
+        SearchResult('http://example.com/1', 'Lalki w ogniu', ['Paweł Jasienica']),
+        SearchResult('http://example.com/2', 'Lalka', ['Bolesław Prus']),
+        SearchResult('http://example.com/3', 'Lalka. Tom 2', ['Bolesław Prus']),
+    ]
+
+    urls = parser.rank_search_results(results, 'Lalka', ['Bolesław Prus'])
+
+    assert urls == ['http://example.com/2', 'http://example.com/3', 'http://example.com/1']
+
+
+def test_exact_title_wins_over_other_volume_listed_first(parser):
+    results = [
+        SearchResult('http://example.com/2', 'Lalka. Tom 2', ['Bolesław Prus']),
+        SearchResult('http://example.com/1', 'Lalka', ['Bolesław Prus']),
+    ]
+
+    assert parser.rank_search_results(results, 'Lalka', ['Bolesław Prus'])[0] == 'http://example.com/1'
+
+
+def test_results_without_snippets_keep_search_page_order(parser):
+    results = [SearchResult('http://example.com/{}'.format(i), None, None) for i in range(3)]
+
+    assert parser.rank_search_results(results, 'Lalka', ['Bolesław Prus']) == [result.url for result in results]
+
+
+def test_duplicates_are_removed_keeping_best_score(parser):
+    results = [
+        SearchResult('http://example.com/1', None, None),
+        SearchResult('http://example.com/2', 'Lalka', None),
+        SearchResult('http://example.com/1', 'Lalka', ['Bolesław Prus']),
+    ]
+
+    assert parser.rank_search_results(results, 'Lalka', ['Bolesław Prus']) == [
+        'http://example.com/1', 'http://example.com/2']
+
+
+def test_only_first_author_is_matched(parser):
+    results = [
+        SearchResult('http://example.com/1', 'Lalka', ['Jan Kowalski']),
+        SearchResult('http://example.com/2', 'Lalka', ['Bolesław Prus']),
+    ]
+
+    urls = parser.rank_search_results(results, 'Lalka', ['Bolesław Prus', 'Jan Kowalski'], only_first_author=True)
+
+    assert urls == ['http://example.com/2', 'http://example.com/1']
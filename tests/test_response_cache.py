@@ -0,0 +1,85 @@
+import io
+
+import pytest
+
+from calibre_plugins.biblionetka.cache_database import CacheDatabase, call_cache
+from calibre_plugins.biblionetka.response_cache import CachingReader, ResponseCache
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return ResponseCache(CacheDatabase(str(tmp_path / 'cache.sqlite')), ttl=3600, max_size=100)
+
+
+def test_least_recently_used_entries_are_evicted(cache, clock):
+    cache.put('a', b'a' * 40)
+    clock.sleep(1)
+    cache.put('b', b'b' * 40)
+    clock.sleep(1)
+    assert cache.get('a').body == b'a' * 40
+    clock.sleep(1)
+    cache.put('c', b'c' * 40)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+
+
+def test_evict_keeps_cache_within_max_size(cache, clock):
+    for name in 'abcde':
+        cache.put(name, name.encode() * 30)
+        clock.sleep(1)
+
+    conn = cache.connection()
+    assert conn.execute('SELECT SUM(size) FROM responses').fetchone()[0] <= 100
+    assert [row[0] for row in conn.execute('SELECT url FROM responses ORDER BY url')] == ['c', 'd', 'e']
+
+
+def test_body_larger_than_max_size_is_not_stored(cache):
+    cache.put('a', b'a' * 101)
+
+    assert cache.get('a') is None
+
+
+def test_no_max_size_disables_eviction(tmp_path, clock):
+    cache = ResponseCache(CacheDatabase(str(tmp_path / 'cache.sqlite')), ttl=3600)
+    for name in 'abcde':
+        cache.put(name, name.encode() * 1000)
+
+    assert all(cache.get(name) for name in 'abcde')
+
+
+class Response(io.BytesIO):
+    headers = {'ETag': '"1"'}
+
+
+@pytest.fixture
+def broken_cache(tmp_path):
+    path = tmp_path / 'cache.sqlite'
+    path.write_bytes(b'not a database' * 1000)
+    return ResponseCache(CacheDatabase(str(path)), ttl=3600)
+
+
+def test_corrupted_database_is_treated_as_miss(broken_cache, log):
+    assert call_cache(log, broken_cache.get, 'a') is None
+    assert call_cache(log, broken_cache.put, 'a', b'body') is None
+    assert len(log.levels('error')) == 2
+
+
+def test_caching_reader_survives_failed_store(broken_cache, log):
+    reader = CachingReader(Response(b'body'), broken_cache, 'a', log)
+    with reader:
+        assert reader.read() == b'body'
+
+    assert log.levels('error')
+
+
+def test_caching_reader_stores_whole_body(cache, log):
+    with CachingReader(Response(b'body'), cache, 'a', log) as reader:
+        reader.read(2)
+        reader.read(2)
+        reader.read(2)
+
+    entry = cache.get('a')
+    assert (entry.body, entry.etag, entry.complete) == (b'body', '"1"', True)
+    assert not log.messages
@@ -0,0 +1,41 @@
+import pytest
+
+from calibre_plugins.biblionetka.settings import Settings
+
+
+@pytest.mark.parametrize('value, default, expected', [
+    (True, False, True),
+    (1, False, False),
+    ('yes', True, True),
+    (5, 2, 5),
+    ('7', 2, 7),
+    ('many', 2, 2),
+    (-1, 2, 2),
+    (True, 2, 2),
+    (None, 2, 2),
+    (1, 0.5, 1.0),
+    (-0.5, 0.5, 0.5),
+    (3, '', '3'),
+])
+def test_validate(value, default, expected):
+    validated = Settings.validate(value, default)
+
+    assert validated == expected
+    assert type(validated) is type(expected)
+
+
+def test_missing_and_invalid_values_fall_back_to_defaults():
+    settings = Settings({'max_results': 'five', 'threads': False}, {'max_results': 2, 'threads': True, 'cache': True})
+
+    assert settings.max_results == 2
+    assert settings.threads is False
+    assert settings.cache is True
+    assert settings.get('series', 'disabled') == 'disabled'
+    assert 'cache' in settings
+
+
+def test_snapshot_is_read_only():
+    settings = Settings({}, {'max_results': 2})
+
+    with pytest.raises(AttributeError):
+        settings.max_results = 5
@@ -0,0 +1,103 @@
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from calibre_plugins.biblionetka.deadline import Deadline
+from calibre_plugins.biblionetka.single_flight import SingleFlight
+
+
+def start_leader(flight, key, release, result='result'):
+    started = threading.Event()
+
+    def function():
+        started.set()
+        release.wait(5)
+        return result
+
+    thread = threading.Thread(target=flight.do, args=(key, function))
+    thread.start()
+    started.wait(5)
+    return thread
+
+
+def test_single_caller_is_not_shared():
+    assert SingleFlight().do('key', lambda x: x * 2, 21) == (42, False)
+
+
+def test_concurrent_caller_shares_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = start_leader(flight, 'key', release)
+    threading.Timer(0.1, release.set).start()
+
+    assert flight.do('key', pytest.fail) == ('result', True)
+    leader.join()
+    assert not flight.calls
+
+
+def test_different_keys_are_not_coalesced():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = start_leader(flight, 'key', release)
+
+    assert flight.do('other', lambda: 'other') == ('other', False)
+    release.set()
+    leader.join()
+
+
+def test_exception_is_shared_and_key_released():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError('failed')
+
+    errors = []
+
+    def leader():
+        try:
+            flight.do('key', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    started.wait(5)
+    threading.Timer(0.1, release.set).start()
+    with pytest.raises(ValueError):
+        flight.do('key', pytest.fail)
+    thread.join()
+
+    assert len(errors) == 1
+    assert flight.do('key', lambda: 'again') == ('again', False)
+
+
+def test_waiter_gives_up_at_deadline():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = start_leader(flight, 'key', release)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        flight.do('key', pytest.fail, deadline=Deadline(0.2))
+    assert time.monotonic() - start < 2
+    release.set()
+    leader.join()
+
+
+def test_waiter_gives_up_on_abort():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = start_leader(flight, 'key', release)
+    abort = threading.Event()
+    threading.Timer(0.1, abort.set).start()
+
+    with pytest.raises(TimeoutError):
+        flight.do('key', pytest.fail, abort=abort)
+    release.set()
+    leader.join()
@@ -0,0 +1,73 @@
+import socket
+
+import pytest
+
+from calibre_plugins.biblionetka.deadline import Deadline
+from calibre_plugins.biblionetka.throttle import RateLimitTimeout, Throttle, TokenBucket
+
+
+def test_burst_is_free_then_requests_are_spaced(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+
+
+def test_tokens_refill_over_time_up_to_burst(clock):
+    bucket = TokenBucket(rate=2, burst=2)
+    bucket.reserve()
+    bucket.reserve()
+
+    clock.sleep(10)
+    assert [bucket.reserve() for _ in range(2)] == [0, 0]
+    assert bucket.reserve() == pytest.approx(0.5)
+
+
+def test_zero_rate_disables_limit(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+
+    assert [bucket.reserve() for _ in range(5)] == [0] * 5
+
+
+def test_pause_holds_back_requests(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+    bucket.pause(5)
+
+    assert bucket.reserve() == pytest.approx(5)
+    clock.sleep(5)
+    assert bucket.reserve() == 0
+
+
+def test_configure_limits_tokens_to_new_burst(clock):
+    bucket = TokenBucket(rate=1, burst=5)
+    bucket.configure(rate=1, burst=1)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(1)
+
+
+def test_throttle_refuses_wait_past_deadline():
+    delay = Throttle(10)
+
+    assert delay.wait(Deadline(30))
+    assert not delay.wait(Deadline(1))
+
+
+def test_wait_past_deadline_raises_without_taking_token(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    bucket.reserve()
+
+    with pytest.raises(socket.timeout):
+        bucket.reserve(Deadline(0.5))
+    assert bucket.reserve(Deadline(2)) == pytest.approx(1)
+
+
+def test_pause_past_deadline_raises(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+    bucket.pause(5)
+
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(Deadline(1))
+    bucket.acquire(Deadline(10))
+    assert clock() == 1005
@@ -0,0 +1,70 @@
+import socket
+import time
+
+import pytest
+
+from calibre_plugins.biblionetka.async_transport import AsyncHttpTransport
+from calibre_plugins.biblionetka.deadline import Deadline
+from calibre_plugins.biblionetka.transport import HttpTransport
+
+
+@pytest.fixture(params=[HttpTransport, AsyncHttpTransport], ids=['sync', 'async'])
+def transport(request):
+    transport = request.param()
+    yield transport
+    transport.close()
+
+
+def test_paused_host_wait_past_deadline_times_out(transport, http_server):
+    transport.limiter('127.0.0.1').pause(5)
+
+    start = time.monotonic()
+    with pytest.raises(socket.timeout):
+        transport.request(http_server.url + '/page', deadline=Deadline(1))
+
+    assert time.monotonic() - start < 0.5
+    assert not http_server.requests
+
+
+def test_rate_limit_wait_within_deadline_is_made(transport, http_server):
+    transport.limiter('127.0.0.1').pause(0.2)
+
+    with transport.request(http_server.url + '/page', deadline=Deadline(5)) as response:
+        assert response.read() == b'ok'
+
+    assert http_server.requests == ['/page']
+
+
+def test_retried_after_delay_requested_by_server(transport, http_server):
+    transport.configure(0, 1, 2, 0.01)
+    http_server.responses.append((503, {'Retry-After': '0.3'}, b''))
+
+    start = time.monotonic()
+    with transport.request(http_server.url + '/page', deadline=Deadline(5)) as response:
+        assert response.status == 200
+        assert response.read() == b'ok'
+
+    assert time.monotonic() - start >= 0.3
+    assert http_server.requests == ['/page', '/page']
+
+
+def test_rejected_response_returned_after_last_attempt(transport, http_server):
+    transport.configure(0, 1, 1, 0.01)
+    http_server.responses.extend([(429, {}, b''), (429, {}, b'')])
+
+    with transport.request(http_server.url + '/page') as response:
+        assert response.status == 429
+
+    assert http_server.requests == ['/page', '/page']
+
+
+def test_retry_after_past_deadline_returns_rejected_response(transport, http_server):
+    transport.configure(0, 1, 2, 0.01)
+    http_server.responses.append((429, {'Retry-After': '10'}, b''))
+
+    start = time.monotonic()
+    with transport.request(http_server.url + '/page', deadline=Deadline(1)) as response:
+        assert response.status == 429
+
+    assert time.monotonic() - start < 0.5
+    assert http_server.requests == ['/page']